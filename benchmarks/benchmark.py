@@ -0,0 +1,348 @@
+"""
+Benchmark the stages of the generation of Piet programs, over a ladder of input sizes, and
+compare timings against a baseline.
+
+    $ python benchmarks/benchmark.py --out results.json --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from hilbertpiet.cli.optimize_numbers import PushNumberOptimizer
+from hilbertpiet.encoding import ENCODINGS, load_transition_costs, transition_costs_filepath
+from hilbertpiet.layout import Layout
+from hilbertpiet.numbers import PushNumber
+from hilbertpiet.path import UNUSED_CODELS_PER_SLOT, NotEnoughSpace, clear_path_cache
+from hilbertpiet.path import generate_path, map_path_u_turns, map_program_to_path
+from hilbertpiet.path import map_program_to_smallest_path, select_iterations
+from hilbertpiet.run import Program
+from hilbertpiet.stream import ChunkedProgram, fits_into_path, render_program
+
+LOGGER = logging.getLogger(__name__)
+
+ROOT: Path = Path(__file__).parent.parent
+NUMBERS_FILEPATH = ROOT / 'hilbertpiet' / 'data' / 'numbers.bin'
+
+# Version of the format of results
+FORMAT_VERSION = 1
+
+
+def _lorem() -> str:
+    return (ROOT / 'lorem.txt').read_text()
+
+
+def _cowsay() -> str:
+    """
+    Lorem ipsum said by a cow, as in the README (`cat lorem.txt | cowsay`).
+    """
+
+    lines = textwrap.wrap(' '.join(_lorem().split()), width=39)
+    width = max(map(len, lines))
+    bubble = [' ' + '_' * (width + 2)]
+    for i, line in enumerate(lines):
+        left, right = ('/', '\\') if i == 0 else ('\\', '/') if i == len(lines) - 1 else '||'
+        bubble.append(f'{left} {line.ljust(width)} {right}')
+    bubble.append(' ' + '-' * (width + 2))
+    cow = ['        \\   ^__^',
+           '         \\  (oo)\\_______',
+           '            (__)\\       )\\/\\',
+           '                ||----w |',
+           '                ||     ||']
+    return '\n'.join(bubble + cow) + '\n'
+
+
+def _synthetic(size: int) -> Callable[[], str]:
+    """
+    Synthetic text of a given number of characters: lorem ipsum words in a pseudo-random order.
+    """
+
+    def text() -> str:
+        words = _lorem().split()
+        rng = random.Random(0)
+        chunks = []
+        length = 0
+        while length < size:
+            line = ' '.join(rng.choice(words) for _ in range(12)) + '\n'
+            chunks.append(line)
+            length += len(line)
+        return ''.join(chunks)[:size]
+
+    return text
+
+
+# Ladder of inputs, by increasing size
+INPUTS: Dict[str, Callable[[], str]] = {
+    'hello': lambda: 'Hello World!',
+    'lorem': _lorem,
+    'cowsay': _cowsay,
+    'synthetic-64k': _synthetic(2 ** 16),
+    'synthetic-1m': _synthetic(2 ** 20)
+}
+
+# Benchmarked stages, in pipeline order
+STAGES = ['encode', 'generate_path', 'map_path_u_turns', 'map_program_to_path', 'run',
+          'run_reference', 'render', 'save_png', 'save_gif', 'render_program', 'optimize_numbers']
+
+# Stages holding whole paths and programs in memory (as opposed to `render_program`)
+IN_MEMORY_STAGES = ['generate_path', 'map_path_u_turns', 'map_program_to_path', 'run',
+                    'run_reference', 'render', 'save_png', 'save_gif']
+
+
+class Timer:
+    """
+    Time functions, a few times each, and collect results.
+
+    Attributes:
+        repeat: maximal number of times functions are timed
+        max_time: functions are timed again only until their cumulative time reaches this
+        results: results by benchmark name (see :meth:`time`)
+    """
+
+    def __init__(self, repeat: int, max_time: float):
+        self.repeat = repeat
+        self.max_time = max_time
+        self.results: Dict[str, Dict] = {}
+
+    def time(self, stage: str, input: str, function: Callable, setup: Callable = None,
+             **info):
+        """
+        Time a function, after `setup` each time, and record the wall times of its calls.
+
+        Returns:
+            The result of its last call.
+        """
+
+        times = []
+        while len(times) < self.repeat and sum(times) < self.max_time:
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+
+        self.results[f'{stage}[{input}]'] = dict(stage=stage, input=input, **info,
+                                                 times=times, best=min(times),
+                                                 median=statistics.median(times))
+        LOGGER.info(f'{stage}[{input}]: {min(times):.6f}s (best of {len(times)})')
+        return result
+
+    def skip(self, stage: str, input: str, reason: str):
+        """
+        Record a skipped benchmark.
+        """
+        self.results[f'{stage}[{input}]'] = dict(stage=stage, input=input, skipped=reason)
+        LOGGER.info(f'{stage}[{input}]: skipped, {reason}')
+
+
+def benchmark_input(timer: Timer, input: str, text: str, stages: List[str], encoding: str,
+                    codel_size: int, max_iterations: int, out_dir: Path):
+    """
+    Benchmark the stages of the generation of the program printing an input.
+    """
+
+    num_chars = [ord(c) for c in text]
+    encode = ENCODINGS[encoding]
+    info = dict(characters=len(num_chars))
+
+    if 'encode' in stages:
+        ops = timer.time('encode', input, lambda: encode(num_chars), **info)
+    else:
+        ops = encode(num_chars)
+    program = Program(ops)
+    info.update(codels=program.size)
+
+    # Number of iterations the program fits into
+    iterations = select_iterations(program.size, UNUSED_CODELS_PER_SLOT)
+
+    if iterations > max_iterations:
+        for stage in IN_MEMORY_STAGES:
+            if stage in stages:
+                timer.skip(stage, input, f'{iterations} iterations, more than {max_iterations}')
+
+    elif any(stage in stages for stage in IN_MEMORY_STAGES):
+        # Not timed: find the number of iterations the program actually fits into
+        _, iterations = map_program_to_smallest_path(program)
+        info.update(iterations=iterations)
+
+        def in_memory_stage(stage: str, function: Callable, default: Callable, **kwargs):
+            if stage in stages:
+                return timer.time(stage, input, function, **kwargs, **info)
+            return default() if default is not None else None
+
+        path = in_memory_stage('generate_path', lambda: generate_path(iterations),
+                               lambda: generate_path(iterations),
+                               setup=clear_path_cache)
+        path = in_memory_stage('map_path_u_turns', lambda: map_path_u_turns(path),
+                               lambda: map_path_u_turns(path))
+        mapped_program = in_memory_stage('map_program_to_path',
+                                         lambda: map_program_to_path(program, path),
+                                         lambda: map_program_to_path(program, path))
+        in_memory_stage('run', lambda: mapped_program.run(compiled=True), None)
+        # Reference interpreter, run in debug mode (`--verbose`)
+        in_memory_stage('run_reference', lambda: mapped_program.run(compiled=False), None)
+        in_memory_stage('render', lambda: mapped_program.render(initial_color='red',
+                                                                codel_size=codel_size), None)
+
+        layout = Layout.from_program(mapped_program)
+        for stage, suffix in [('save_png', '.png'), ('save_gif', '.gif')]:
+            filepath = out_dir / f'{input}{suffix}'
+            in_memory_stage(stage, lambda: layout.save(filepath, initial_color='red',
+                                                       codel_size=codel_size), None)
+
+    if 'render_program' in stages:
+        chunked_program = ChunkedProgram(num_chars, encode)
+        iterations = select_iterations(program.size)
+        # Not timed: mapping is only attempted once known to succeed (as in large input mode)
+        while not fits_into_path(chunked_program, iterations):
+            iterations += 1
+
+        def stream():
+            try:
+                render_program(chunked_program, iterations, out_dir / f'{input}-stream.png',
+                               initial_color='red', codel_size=codel_size)
+            except NotEnoughSpace:
+                raise RuntimeError(f'Program of {input} unexpectedly doesn\'t fit into '
+                                   f'{iterations} iterations')
+
+        timer.time('render_program', input, stream, **dict(info, iterations=iterations))
+
+
+def run_benchmarks(inputs: List[str], stages: List[str], encoding: str = 'plain',
+                   codel_size: int = 1, max_iterations: int = 6, repeat: int = 5,
+                   max_time: float = 10) -> Dict:
+    """
+    Run benchmarks over a ladder of inputs (see :data:`INPUTS`).
+
+    Returns:
+        Results, with benchmarks by name.
+    """
+
+    PushNumber.load_numbers(NUMBERS_FILEPATH)
+    load_transition_costs(transition_costs_filepath(NUMBERS_FILEPATH))
+
+    timer = Timer(repeat=repeat, max_time=max_time)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for input in inputs:
+            benchmark_input(timer, input, INPUTS[input](), stages, encoding, codel_size,
+                            max_iterations, Path(out_dir))
+
+    if 'optimize_numbers' in stages:
+        def optimize():
+            PushNumberOptimizer(max_num=127).optimize()
+
+        timer.time('optimize_numbers', 'numbers-127', optimize)
+        # The optimizer replaces the trees of numbers it optimizes
+        PushNumber.load_numbers(NUMBERS_FILEPATH)
+
+    return {
+        'version': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'settings': dict(encoding=encoding, codel_size=codel_size, max_iterations=max_iterations,
+                         repeat=repeat, max_time=max_time),
+        'benchmarks': timer.results
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float,
+            min_difference: float = 0) -> List[Dict]:
+    """
+    Compare the best time of benchmarks against a baseline.
+
+    Returns:
+        The comparison of each benchmark run in both: its name, best times and their ratio, and
+        whether it regressed (its ratio is more than `1 + threshold`, and it is more than
+        `min_difference` seconds slower).
+    """
+
+    comparisons = []
+    for name, benchmark in results['benchmarks'].items():
+        baseline_benchmark = baseline['benchmarks'].get(name)
+        if 'best' not in benchmark or baseline_benchmark is None \
+                or 'best' not in baseline_benchmark:
+            continue
+        ratio = benchmark['best'] / baseline_benchmark['best']
+        comparisons.append(dict(name=name, best=benchmark['best'],
+                                baseline=baseline_benchmark['best'], ratio=ratio,
+                                regression=(ratio > 1 + threshold and benchmark['best'] -
+                                            baseline_benchmark['best'] > min_difference)))
+    return comparisons
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--inputs', nargs='+', choices=list(INPUTS), default=list(INPUTS),
+                        help='inputs to benchmark (default: all)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='stages to benchmark (default: all)')
+    parser.add_argument('--encoding', '-e', choices=list(ENCODINGS), default='plain',
+                        help='character encoding (default: %(default)s)')
+    parser.add_argument('--codel-size', '-n', type=int, default=1,
+                        help='codel size of rendered images (default: %(default)s)')
+    parser.add_argument('--max-iterations', type=int, default=6,
+                        help='largest number of Hilbert curve iterations of the programs held in '
+                             'memory; larger programs are only streamed (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of times each stage is timed, at most (default: '
+                             '%(default)s)')
+    parser.add_argument('--max-time', type=float, default=10,
+                        help='a stage is timed again only until its cumulative time reaches '
+                             'this, in seconds (default: %(default)s)')
+    parser.add_argument('--out', '-o', type=Path, help='output JSON file of results')
+    parser.add_argument('--baseline', '-b', type=Path, help='JSON file of baseline results')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative slowdown of the best time of a stage, against the '
+                             'baseline, considered a regression (default: %(default)s)')
+    parser.add_argument('--min-difference', type=float, default=0.001,
+                        help='absolute slowdown of the best time of a stage, against the '
+                             'baseline, below which it is never considered a regression, in '
+                             'seconds (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+
+    results = run_benchmarks(args.inputs, args.stages, encoding=args.encoding,
+                             codel_size=args.codel_size, max_iterations=args.max_iterations,
+                             repeat=args.repeat, max_time=args.max_time)
+
+    if args.out is not None:
+        with args.out.open('w') as f:
+            json.dump(results, f, indent=2)
+        LOGGER.info(f'Saved results to {args.out}')
+
+    if args.baseline is None:
+        return 0
+
+    with args.baseline.open() as f:
+        baseline = json.load(f)
+
+    comparisons = compare(results, baseline, args.threshold, args.min_difference)
+
+    LOGGER.info('')
+    LOGGER.info(f'{"benchmark":<40} {"best":>10} {"baseline":>10} {"ratio":>7}')
+    for comparison in comparisons:
+        flag = '  REGRESSION' if comparison['regression'] else ''
+        LOGGER.info(f'{comparison["name"]:<40} {comparison["best"]:>10.6f} '
+                    f'{comparison["baseline"]:>10.6f} {comparison["ratio"]:>7.2f}{flag}')
+
+    regressions = [comparison for comparison in comparisons if comparison['regression']]
+    LOGGER.info('')
+    LOGGER.info(f'{len(regressions)} regressions out of {len(comparisons)} benchmarks')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import argparse
+import json
+import logging
+import os
+import string
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from hilbertpiet.encoding import ENCODINGS
+from hilbertpiet.layout import Layout
+from hilbertpiet.pages import init_worker
+from hilbertpiet.path import map_program_to_smallest_path
+from hilbertpiet.run import Program
+
+LOGGER = logging.getLogger(__name__)
+
+# Suffix of input files, when inputs are a directory
+INPUT_SUFFIX = '.txt'
+
+
+@dataclass
+class Job:
+    """
+    Generation of the image of a Piet program printing the content of an input file, or a given
+    input string.
+
+    Attributes:
+        input: input string file
+        out: output image file
+        text: input string, rather than the content of `input`
+        encoding: character encoding (see :data:`hilbertpiet.encoding.ENCODINGS`)
+        initial_color: initial color of the image
+        codel_size: output codel size
+        run: run the program, to check its output
+    """
+
+    input: Optional[Path]
+    out: Path
+    text: Optional[str] = None
+    encoding: str = 'plain'
+    initial_color: str = 'red'
+    codel_size: int = 20
+    run: bool = True
+
+
+def read_jobs(inputs: Path, out_dir: Path = None, suffix: str = '.png',
+              **defaults) -> List[Job]:
+    """
+    Read jobs from a directory of input files, or from a manifest file.
+
+    Args:
+        inputs: either a directory, whose input files (see :data:`INPUT_SUFFIX`) each make a job,
+            or a JSONL manifest, each line of which is a job: an object with `input` and `out`
+            files (relative to the manifest directory) or `text` and `out`, and optionally any
+            other attribute of :class:`Job`
+        out_dir: directory of output images of a directory of inputs (default: that directory)
+        suffix: image file suffix of output images of a directory of inputs
+        defaults: default attributes of jobs
+
+    Raises:
+        ValueError: a job of the manifest is invalid.
+    """
+
+    if inputs.is_dir():
+        out_dir = out_dir or inputs
+        return [Job(input=filepath, out=out_dir / f'{filepath.stem}{suffix}', **defaults)
+                for filepath in sorted(inputs.glob(f'*{INPUT_SUFFIX}'))]
+
+    jobs = []
+    with inputs.open() as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                jobs.append(parse_job(dict(defaults, **parse_json(line)), inputs.parent))
+            except ValueError as e:
+                raise ValueError(f'{e} on line {line_number} of {inputs}')
+
+    return jobs
+
+
+def parse_json(line: str) -> Dict:
+    """
+    Parse a JSON object.
+
+    Raises:
+        ValueError: the line isn't a JSON object.
+    """
+
+    try:
+        attributes = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Invalid JSON: {e}')
+    if not isinstance(attributes, dict):
+        raise ValueError(f'Invalid JSON object: {line.strip()}')
+    return attributes
+
+
+def parse_job(attributes: Dict, directory: Path) -> Job:
+    """
+    Parse a job from its attributes: `input` and `out` files (relative to a given directory) or
+    `text` and `out`, and optionally any other attribute of :class:`Job`.
+
+    Raises:
+        ValueError: the job is invalid.
+    """
+
+    attributes = dict(attributes)
+    try:
+        if 'text' in attributes:
+            attributes.setdefault('input', None)
+        else:
+            attributes['input'] = directory / attributes['input']
+        attributes['out'] = directory / attributes['out']
+        job = Job(**attributes)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f'Invalid job: {e!r}')
+
+    if job.encoding not in ENCODINGS:
+        raise ValueError(f'Invalid encoding: {job.encoding}')
+
+    return job
+
+
+def run_job(job: Job) -> Dict:
+    """
+    Generate the image of a job.
+
+    Returns:
+        The result record of the job: its input and output files, its status (`ok` or `error`,
+        along with the error), the size of its program and the wall time of each of its stages,
+        in seconds.
+    """
+
+    record = {'out': str(job.out)}
+    if job.input is not None:
+        record['input'] = str(job.input)
+    timings = {}
+
+    start = time.perf_counter()
+    last = start
+
+    def time_stage(stage: str):
+        nonlocal last
+        now = time.perf_counter()
+        timings[stage] = round(now - last, 6)
+        last = now
+
+    try:
+        input = job.input.read_text() if job.text is None else job.text
+        printable = set(string.printable)
+        num_chars = [ord(c) for c in input if c in printable]
+        time_stage('read')
+
+        program = Program(ENCODINGS[job.encoding](num_chars))
+        time_stage('encode')
+
+        program, iterations = map_program_to_smallest_path(program)
+        time_stage('map')
+
+        if job.run:
+            context = program.run(compiled=True)
+            if context.output != ''.join(map(chr, num_chars)):
+                raise RuntimeError('Program output differs from input')
+            time_stage('run')
+
+        Layout.from_program(program).save(job.out, initial_color=job.initial_color,
+                                          codel_size=job.codel_size)
+        time_stage('save')
+
+    except Exception as e:
+        record.update(status='error', error=f'{type(e).__name__}: {e}')
+
+    else:
+        record.update(status='ok', characters=len(num_chars), iterations=iterations,
+                      codels=program.size)
+
+    timings['total'] = round(time.perf_counter() - start, 6)
+    record['timings'] = timings
+
+    return record
+
+
+def run_jobs(jobs: List[Job], numbers_filepath: Path, processes: int = None) -> Iterator[Dict]:
+    """
+    Run jobs in a pool of processes, each of which loads numbers once for all of its jobs.
+
+    Returns:
+        The result records of jobs (see :func:`run_job`), in order, as soon as available.
+    """
+
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=init_worker,
+                             initargs=(numbers_filepath,)) as executor:
+        yield from executor.map(run_job, jobs)
+
+
+def main():
+    description = 'Generate the Hilbert-curve-shaped Piet programs printing a batch of files'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('inputs', type=Path,
+                        help=f'directory of input files (*{INPUT_SUFFIX}), or JSONL manifest of '
+                             f'jobs, each line an object with "input" and "out" files (or "text" '
+                             f'and "out"), and optionally "encoding", "initial_color", '
+                             f'"codel_size" and "run"')
+    parser.add_argument('--out-dir', '-d', type=Path,
+                        help='output directory of images of a directory of input files '
+                             '(default: input directory)')
+    parser.add_argument('--format', type=str, default='png',
+                        help='image format of a directory of input files (default: %(default)s)')
+    parser.add_argument('--results', '-r', type=argparse.FileType('w'), default=sys.stdout,
+                        help='output JSONL file of job results (default stdout)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='debug mode')
+    parser.add_argument('--codel-size', '-n', type=int, default=20,
+                        help='default output codel size (default: %(default)s)')
+    parser.add_argument('--initial-color', '-c', type=str, default='red',
+                        help='default initial color (default: %(default)s)')
+    parser.add_argument('--encoding', '-e', choices=list(ENCODINGS), default='plain',
+                        help='default character encoding (default: %(default)s)')
+    parser.add_argument('--no-run', action='store_true',
+                        help="don't run programs to check their output")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help='number of processes (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error(f'invalid number of jobs: {args.jobs}')
+
+    # Setup logging
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(message)s')
+
+    # Read jobs
+
+    try:
+        jobs = read_jobs(args.inputs, out_dir=args.out_dir, suffix=f'.{args.format}',
+                         encoding=args.encoding, initial_color=args.initial_color,
+                         codel_size=args.codel_size, run=not args.no_run)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    LOGGER.info(f'{len(jobs)} jobs, {args.jobs} processes')
+
+    # Run jobs
+
+    MODULE_ROOT: Path = Path(__file__).parent.parent
+    numbers_filepath = MODULE_ROOT / 'data' / 'numbers.bin'
+
+    start = time.perf_counter()
+    failures = 0
+
+    for record in run_jobs(jobs, numbers_filepath, processes=args.jobs):
+        if record['status'] != 'ok':
+            failures += 1
+            # Jobs given as text have no input file
+            LOGGER.error(f'{record.get("input", record["out"])}: {record["error"]}')
+        args.results.write(json.dumps(record) + '\n')
+        args.results.flush()
+
+    LOGGER.info(f'{len(jobs) - failures} jobs succeeded, {failures} failed, '
+                f'in {time.perf_counter() - start:.1f}s')
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,26 @@
 import argparse
 import io
 import logging
+import os
 import string
 import sys
+from array import array
 from pathlib import Path
+from typing import TYPE_CHECKING, Dict
 
-from hilbertpiet.color import Color
-from hilbertpiet.numbers import PushNumber
-from hilbertpiet.ops import OutChar
-from hilbertpiet.path import NotEnoughSpace, generate_path, map_path_u_turns, map_program_to_path
-from hilbertpiet.run import Program
+from hilbertpiet.stats import Stats
+
+if TYPE_CHECKING:
+    from hilbertpiet.stream import ChunkedProgram
+
+# Modules of the package (along with numpy, PIL and the table of numbers) are only imported by
+# the stages that need them, so that invalid arguments and --help are handled right away
 
 LOGGER = logging.getLogger(__name__)
 
+# Names of character encodings (see :data:`hilbertpiet.encoding.ENCODINGS`)
+ENCODING_NAMES = ['plain', 'stack', 'delta']
+
 
 def main():
     description = 'Generate a Hilbert-curve-shaped Piet program printing a given string'
@@ -27,93 +35,275 @@ def main():
                         help='output codel size (default: %(default)s)')
     parser.add_argument('--initial-color', '-c', type=str, default='red',
                         help='initial color (default: %(default)s)')
-    parser.add_argument('--out', '-o', type=Path, required=True, help='output image file')
+    parser.add_argument('--encoding', '-e', choices=ENCODING_NAMES, default='plain',
+                        help='how characters are encoded as Piet operations: "plain" pushes '
+                             'every character code, "stack" reuses the character codes kept on '
+                             'the stack, "delta" reaches character codes from the previous ones '
+                             '(default: %(default)s)')
+    parser.add_argument('--no-run', action='store_true',
+                        help="don't run the program to check its output")
+    parser.add_argument('--plan', action='store_true',
+                        help='only report the predicted size of the program and image, without '
+                             'mapping, running or rendering the program')
+    parser.add_argument('--large', action='store_true',
+                        help='large input mode: stream the program from input to image with '
+                             'bounded memory (PNG output only)')
+    parser.add_argument('--pages', type=int, metavar='ITERATIONS',
+                        help='paging mode: split input into pages, each printed by its own '
+                             'program of at most this many Hilbert curve iterations, generated '
+                             'in parallel')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help='number of processes generating pages (default: %(default)s)')
+    parser.add_argument('--stats', nargs='?', const='-', metavar='FILE',
+                        help='report wall time, CPU time and peak memory of each stage, along with '
+                             'figures about the program and image, as JSON into a file (default '
+                             'stderr)')
+    parser.add_argument('--out', '-o', type=Path, help='output image file')
     parser.set_defaults(input=sys.stdin)
     args = parser.parse_args()
 
+    if args.out is None and not args.plan:
+        parser.error('the following arguments are required: --out/-o')
+    if args.large and args.out is not None and args.out.suffix != '.png':
+        parser.error('large input mode only renders PNG images')
+    if args.pages is not None and args.large:
+        parser.error('paging mode and large input mode are exclusive')
+    if args.pages is not None and args.pages < 1:
+        parser.error(f'invalid number of iterations for pages: {args.pages}')
+    if args.jobs < 1:
+        parser.error(f'invalid number of jobs: {args.jobs}')
+
     # Setup logging
 
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
                         format='%(message)s')
 
+    stats = Stats(trace_memory=args.stats is not None)
+
+    try:
+        generate(args, stats)
+        stats.update(status='ok')
+    except Exception:
+        stats.update(status='error')
+        raise
+    finally:
+        if args.stats == '-':
+            stats.write(sys.stderr)
+        elif args.stats is not None:
+            with open(args.stats, 'w') as f:
+                stats.write(f)
+
+
+def generate(args: argparse.Namespace, stats: Stats):
+    """
+    Generate the program printing the input, and save its image, recording statistics of each
+    stage.
+    """
+
     # Read input
 
-    input = ''.join(args.input.readlines())
-    LOGGER.info(f'Input length = {len(input)}')
+    with stats.stage('read'):
+        input = args.input.read()
+        printable = set(string.printable)
+        num_chars = array('B', (ord(c) for c in input if c in printable))
 
-    num_chars = [ord(c) for c in input if c in set(string.printable)]
+    LOGGER.info(f'Input length = {len(input)}')
     LOGGER.info(f'Skipping {len(input) - len(num_chars)} non-ascii characters')
-
     LOGGER.info('')
+    stats.update(input_length=len(input), characters=len(num_chars))
+
+    # Load numbers
+
+    with stats.stage('load'):
+        from hilbertpiet.encoding import ENCODINGS, load_transition_costs
+        from hilbertpiet.encoding import transition_costs_filepath
+        from hilbertpiet.numbers import PushNumber
+        from hilbertpiet.path import UNUSED_CODELS_PER_SLOT, load_path
+        from hilbertpiet.path import map_program_to_smallest_path, path_dimensions, path_size
+        from hilbertpiet.path import select_iterations
+        from hilbertpiet.run import Program
+
+        MODULE_ROOT: Path = Path(__file__).parent.parent
+        numbers_filepath = MODULE_ROOT / 'data' / 'numbers.bin'
+        PushNumber.load_numbers(numbers_filepath)
+        load_transition_costs(transition_costs_filepath(numbers_filepath))
+
+    if args.pages is not None and not args.plan:
+        from hilbertpiet.pages import generate_pages, manifest_filepath
+
+        with stats.stage('pages'):
+            pages = generate_pages(num_chars, args.out, args.pages, args.encoding,
+                                   initial_color=args.initial_color, codel_size=args.codel_size,
+                                   numbers_filepath=numbers_filepath, run=not args.no_run,
+                                   jobs=args.jobs)
+        LOGGER.info(f'Saved {len(pages)} pages, listed in {manifest_filepath(args.out)}')
+        stats.update(pages=len(pages), codels_after_mapping=sum(page.codels for page in pages),
+                     file_size=sum(page.image.stat().st_size for page in pages))
+        return
 
     # Create program
 
-    MODULE_ROOT: Path = Path(__file__).parent.parent
-    PushNumber.load_numbers(MODULE_ROOT / 'data' / 'numbers.pkl')
+    with stats.stage('encode'):
+        if args.large:
+            from hilbertpiet.stream import ChunkedProgram
 
-    ops = []
-    for num_char in num_chars:
-        ops += [PushNumber(num_char), OutChar()]
-    program = Program(ops)
+            # Characters are encoded as they are mapped, chunk by chunk
+            program = ChunkedProgram(num_chars, ENCODINGS[args.encoding])
+        else:
+            program = Program(ENCODINGS[args.encoding](num_chars))
+        size = program.size
 
-    LOGGER.info(f'{program.size} codels before mapping')
-    LOGGER.debug(f'Piet operations = {program.ops}')
+    LOGGER.info(f'{size} codels before mapping')
+    if not args.large:
+        LOGGER.debug(f'Piet operations = {program.ops}')
     LOGGER.info('')
+    stats.update(codels_before_mapping=size)
+
+    # Select number of Hilbert curve iterations
+
+    iterations = max(1, select_iterations(program.size))
+
+    if args.plan and args.pages is not None:
+        from hilbertpiet.pages import split_pages
+
+        with stats.stage('plan'):
+            bounds = split_pages(num_chars, ENCODINGS[args.encoding], args.pages)
+        width, height = path_dimensions(args.pages)
+        stats.update(pages=len(bounds), iterations=args.pages,
+                     **_image_figures(width, height, args.codel_size))
+        LOGGER.info(f'{len(bounds)} pages of {args.pages} Hilbert curve iterations')
+        LOGGER.info(f'Page image size = {width * args.codel_size}x{height * args.codel_size} '
+                    f'pixels ({width}x{height} codels)')
+        return
+
+    if args.plan:
+        # Account for codels usually left unused by the mapping
+        iterations = max(1, select_iterations(program.size, UNUSED_CODELS_PER_SLOT))
+        width, height = path_dimensions(iterations)
+        stats.update(iterations=iterations, codels_after_mapping=path_size(iterations),
+                     **_image_figures(width, height, args.codel_size))
+        LOGGER.info(f'{iterations} Hilbert curve iterations (predicted)')
+        LOGGER.info(f'{path_size(iterations)} codels after mapping (predicted)')
+        LOGGER.info(f'Image size = {width * args.codel_size}x{height * args.codel_size} pixels '
+                    f'({width}x{height} codels)')
+        return
+
+    if args.large:
+        main_large(program, iterations, args, stats)
+        return
 
     # Create path and map program
 
-    # Fine-tune necessary number of Hilbert curve iterations within a certain range
-    max_iterations = 4
-    iterations = 1
-    success = False
-    while not success:
-        path = generate_path(iterations)
-        path = map_path_u_turns(path)
-        try:
-            program = map_program_to_path(program, path)
-        except NotEnoughSpace:
-            if iterations >= max_iterations:
-                raise
-            else:
-                iterations += 1
-        else:
-            success = True
+    with stats.stage('path'):
+        # Mapping loads the path, unless the program doesn't fit into it
+        load_path(iterations)
+
+    with stats.stage('map'):
+        program, iterations = map_program_to_smallest_path(program)
 
     LOGGER.info(f'{iterations} Hilbert curve iterations')
     LOGGER.info(f'{program.size} codels after mapping')
     LOGGER.info('')
+    stats.update(iterations=iterations, codels_after_mapping=program.size)
 
-    # Run program
+    # Lay out codels
 
-    context = program.run()
+    with stats.stage('layout'):
+        from hilbertpiet.layout import Layout
 
-    # Log program output
+        layout = Layout.from_program(program)
 
-    printable_output = context.output.strip()
-    if '\n' in printable_output:
-        # Indent output lines
-        printable_output = '\n   ' + printable_output.replace('\n', '\n   ')
-    LOGGER.debug('')
+    # Run program, to check its output
 
-    LOGGER.info(f'Ouput: {printable_output}')
-    LOGGER.info('')
+    if not args.no_run:
+        with stats.stage('run'):
+            # Only the reference interpreter logs operations one by one
+            context = program.run(compiled=not args.verbose)
+
+        # Log program output
+
+        printable_output = context.output.strip()
+        if '\n' in printable_output:
+            # Indent output lines
+            printable_output = '\n   ' + printable_output.replace('\n', '\n   ')
+        LOGGER.debug('')
+
+        LOGGER.info(f'Ouput: {printable_output}')
+        LOGGER.info('')
+
+        if context.output != ''.join(map(chr, num_chars)):
+            raise RuntimeError('Program output differs from input')
 
     # Draw codels
 
     LOGGER.info(f'Saving program to {args.out}')
 
-    if args.out.suffix == '.gif':
-        imgs = []
-        for hue in range(6):
-            initial_color = str(Color(lightness=1, hue=hue))
-            img = program.render(initial_color=initial_color, codel_size=args.codel_size)
-            imgs.append(img)
-        imgs[0].save(args.out, append_images=imgs[1:], duration=600, loop=0,
-                     save_all=True, optimize=False)
-
-    else:
-        img = program.render(initial_color=args.initial_color, codel_size=args.codel_size)
-        img.save(args.out)
+    with stats.stage('save'):
+        layout.save(args.out, initial_color=args.initial_color, codel_size=args.codel_size)
+
+    width, height = path_dimensions(iterations)
+    stats.update(**_image_figures(width, height, args.codel_size),
+                 file_size=args.out.stat().st_size)
+
+
+def main_large(program: 'ChunkedProgram', iterations: int, args: argparse.Namespace,
+               stats: Stats):
+    """
+    Map, run and render a program in large input mode, streaming it from input to image.
+    """
+
+    from hilbertpiet.path import UNUSED_CODELS_PER_SLOT, NotEnoughSpace, check_op_sizes
+    from hilbertpiet.path import path_dimensions, path_size, select_iterations
+    from hilbertpiet.stream import ExpectedOutput, fits_into_path, render_program
+
+    # Mapping a program that nearly fills a path is only attempted once known to succeed
+    if select_iterations(program.size, 2 * UNUSED_CODELS_PER_SLOT) > iterations:
+        with stats.stage('fit'):
+            if not fits_into_path(program, iterations):
+                iterations += 1
+
+    expected_output = ''.join(map(chr, program.num_chars))
+
+    LOGGER.info(f'Saving program to {args.out}')
+
+    # Mapping, running and rendering are interleaved, chunk by chunk: a single stage
+    with stats.stage('render_program'):
+        while True:
+            sink = None if args.no_run else ExpectedOutput(expected_output)
+            try:
+                render_program(program, iterations, args.out, initial_color=args.initial_color,
+                               codel_size=args.codel_size, run=not args.no_run, sink=sink)
+            except NotEnoughSpace:
+                # The program fits into a larger path, unless some of its operations fit into no
+                # slot at all
+                check_op_sizes(program)
+                LOGGER.debug(f"Program doesn't fit into {iterations} Hilbert curve iterations")
+                iterations += 1
+            else:
+                break
+
+    width, height = path_dimensions(iterations)
+    stats.update(iterations=iterations, codels_after_mapping=path_size(iterations),
+                 **_image_figures(width, height, args.codel_size),
+                 file_size=args.out.stat().st_size)
+
+    LOGGER.info('')
+    LOGGER.info(f'{iterations} Hilbert curve iterations')
+    LOGGER.info(f'{path_size(iterations)} codels after mapping')
+    LOGGER.info('')
+
+    if sink is not None:
+        if not sink.complete:
+            raise RuntimeError('Program output differs from input')
+        LOGGER.info(f'Output matches input ({sink.position} characters)')
+
+
+def _image_figures(width: int, height: int, codel_size: int) -> Dict[str, int]:
+    """
+    Statistics about the size of an image, given its size in codels.
+    """
+    return {'image_width': width * codel_size, 'image_height': height * codel_size,
+            'codels_width': width, 'codels_height': height}
 
 
 if __name__ == '__main__':
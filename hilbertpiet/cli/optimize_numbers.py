@@ -1,16 +1,26 @@
 from __future__ import annotations
 
 import argparse
+import heapq
 import logging
 import operator
-import pickle
-from math import log, sqrt
+from math import log
 from pathlib import Path
+from typing import List, Tuple
 
-from hilbertpiet.numbers import PushNumber
+import numpy as np
+
+from hilbertpiet.encoding import save_transition_costs, transition_costs_filepath
+from hilbertpiet.numbers import BaseNumberTree, NumberTable, PushNumber, UnaryNumberTree
 
 LOGGER = logging.getLogger(__name__)
 
+# Back-pointer operations
+_NO_OP, _ADD, _SUB, _MUL, _DIV, _POW = range(6)
+
+_BINARY_OPS = {_ADD: operator.add, _SUB: operator.sub, _MUL: operator.mul,
+               _DIV: operator.floordiv, _POW: operator.pow}
+
 
 class PushNumberOptimizer:
     """
@@ -26,39 +36,109 @@ class PushNumberOptimizer:
         self.max_num = max_num
         self.nums = {n: PushNumber(n) for n in range(1, max_num + 1)}
 
-    def _optimize_add(self):
-        for i in range(2, self.max_num - 2 + 1):
-            for j in range(i, self.max_num - i + 1):
-                self._step(operator.add, i, j)
+        # Start from the dumbest representation of numbers, whatever numbers were loaded
+        for n, num in self.nums.items():
+            num._tree = UnaryNumberTree(n)
 
-    def _optimize_sub(self):
-        for i in range(self.max_num, 1, -1):
-            for j in range(1, i):
-                self._step(operator.sub, i, j)
-
-    def _optimize_mult(self):
-        for i in range(2, self.max_num // 2 + 1):
-            for j in range(i, self.max_num // i + 1):
-                self._step(operator.mul, i, j)
-
-    def _optimize_div(self):
-        for i in range(self.max_num, 1, -1):
-            for j in range(2, i // 2):
-                self._step(operator.floordiv, i, j)
+    def optimize(self) -> int:
+        """
+        Optimize numbers until reaching a fixed point, i.e. until no combination of two numbers
+        yields a cheaper representation of any number.
 
-    def _optimize_pow(self):
-        for i in range(2, int(sqrt(self.max_num) + 1)):
-            for j in range(2, int(log(self.max_num, i) + 1)):
-                self._step(operator.pow, i, j)
+        Returns:
+            The number of relaxations, i.e. of times a number got a cheaper representation.
 
-    def _step(self, binary_op, i: int, j: int):
-        old_cost = self.nums[binary_op(i, j)]._cost
+        Notes:
+            Dijkstra-style worklist: numbers are settled by increasing cost. The cost of a
+            combination of two numbers is higher than the cost of each of them, hence the cost of
+            the cheapest remaining number is final. Once settled, a number is combined with all
+            the numbers settled before it at once.
 
-        candidate_tree = binary_op(self.nums[i]._tree, self.nums[j]._tree)
-        new_cost = candidate_tree._cost
+            The search only operates on arrays of costs and back-pointers (operation and operands
+            of the cheapest known combination producing each number). Trees are only built for
+            the winning combinations, once the fixed point is reached.
+        """
 
-        if new_cost < old_cost:
-            self.nums[binary_op(i, j)]._tree = candidate_tree
+        max_num = self.max_num
+
+        costs = np.zeros(max_num + 1, dtype=np.int64)
+        for n, num in self.nums.items():
+            costs[n] = num._cost
+
+        # Back-pointers
+        back_ops = np.full(max_num + 1, _NO_OP, dtype=np.int8)
+        back_lefts = np.zeros(max_num + 1, dtype=np.int64)
+        back_rights = np.zeros(max_num + 1, dtype=np.int64)
+
+        worklist = [(int(costs[n]), n) for n in self.nums]
+        heapq.heapify(worklist)
+
+        settled = np.zeros(max_num, dtype=np.int64)
+        n_settled = 0
+        relaxations = 0
+
+        while worklist:
+            cost, i = heapq.heappop(worklist)
+            if cost > costs[i]:
+                # Outdated worklist entry
+                continue
+
+            settled[n_settled] = i
+            n_settled += 1
+            js = settled[:n_settled]
+
+            # Candidate combinations of `i` with each settled number: their operation, the
+            # number they produce, their operands and their cost
+            combination_costs = cost + costs[js] + 1
+            candidates = [(_ADD, i + js, i, js, combination_costs),
+                          (_SUB, i - js, i, js, combination_costs),
+                          (_SUB, js - i, js, i, combination_costs)]
+            if i > 1:
+                mask = js > 1
+                js, combination_costs = js[mask], combination_costs[mask]
+                candidates += [(_MUL, i * js, i, js, combination_costs),
+                               (_DIV, i // js, i, js, combination_costs),
+                               (_DIV, js // i, js, i, combination_costs)]
+
+                # The cost of a power doesn't depend on the cost of the exponent
+                exponents = np.arange(2, int(log(max_num, i) + 1) + 1)
+                candidates.append((_POW, i ** exponents, i, exponents,
+                                   cost + 2 * (exponents - 1)))
+
+            ops, ns, lefts, rights, candidate_costs = _concatenate_candidates(candidates, costs)
+
+            # Several candidates may produce the same number: keep the cheapest one
+            order = np.lexsort((candidate_costs, ns))
+            ns = ns[order]
+            first = np.ones(len(ns), dtype=bool)
+            first[1:] = ns[1:] != ns[:-1]
+            order, ns = order[first], ns[first]
+
+            costs[ns] = candidate_costs[order]
+            back_ops[ns] = ops[order]
+            back_lefts[ns] = lefts[order]
+            back_rights[ns] = rights[order]
+
+            for n, n_cost in zip(ns.tolist(), candidate_costs[order].tolist()):
+                heapq.heappush(worklist, (n_cost, n))
+            relaxations += len(ns)
+
+        # Build the trees of the winning combinations
+
+        trees = {}
+
+        def build_tree(n: int) -> BaseNumberTree:
+            if back_ops[n] == _NO_OP:
+                return self.nums[n]._tree
+            if n not in trees:
+                binary_op = _BINARY_OPS[back_ops[n]]
+                trees[n] = binary_op(build_tree(back_lefts[n]), build_tree(back_rights[n]))
+            return trees[n]
+
+        for n in np.flatnonzero(back_ops != _NO_OP).tolist():
+            self.nums[n]._tree = build_tree(n)
+
+        return relaxations
 
     @property
     def _cost(self):
@@ -72,8 +152,29 @@ class PushNumberOptimizer:
         Save tree representation of numbers into a file.
         """
         trees = {n: self.nums[n]._tree for n in self.nums}
-        with out_filepath.open('wb') as f:
-            pickle.dump(trees, f)
+        NumberTable.from_trees(trees).save(out_filepath)
+
+
+def _concatenate_candidates(candidates: List[Tuple], costs: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Concatenate the candidate combinations improving a number within range, into flat arrays of
+    operations, produced numbers, left operands, right operands and costs.
+    """
+
+    max_num = len(costs) - 1
+
+    ops, ns, lefts, rights, improved_costs = [], [], [], [], []
+    for op, candidate_ns, left, right, candidate_costs in candidates:
+        mask = (candidate_ns > 0) & (candidate_ns <= max_num)
+        mask[mask] = candidate_costs[mask] < costs[candidate_ns[mask]]
+
+        ns.append(candidate_ns[mask])
+        ops.append(np.full(len(ns[-1]), op, dtype=np.int8))
+        lefts.append(np.broadcast_to(left, candidate_ns.shape)[mask])
+        rights.append(np.broadcast_to(right, candidate_ns.shape)[mask])
+        improved_costs.append(candidate_costs[mask])
+
+    return tuple(map(np.concatenate, (ops, ns, lefts, rights, improved_costs)))
 
 
 def main():
@@ -82,7 +183,7 @@ def main():
     rw_group.add_argument('--show-only', action='store_true', help='only load and display numbers')
     parser.add_argument('--limit', type=int, nargs='?', default=128,
                         help='limit number to optimize (default: %(default)s)')
-    parser.add_argument('filepath', type=Path, help='pickled numbers filepath')
+    parser.add_argument('filepath', type=Path, help='numbers filepath')
     parser.add_argument('--verbose', '-v', action='store_true', help='debug mode')
     args = parser.parse_args()
 
@@ -96,24 +197,28 @@ def main():
     if not args.show_only:
         opt = PushNumberOptimizer(max_num=args.limit)
 
-        LOGGER.info(f'Round 0: cost={opt._cost}')
+        LOGGER.info(f'Initial cost={opt._cost}')
 
-        optimizations = [opt._optimize_pow,
-                         opt._optimize_mult, opt._optimize_div,
-                         opt._optimize_add, opt._optimize_sub] * 2
-
-        for i, optimize in enumerate(optimizations, 1):
-            optimize()
-            LOGGER.info(f'Round {i}: cost={opt._cost}, {optimize.__name__}')
+        relaxations = opt.optimize()
+        LOGGER.info(f'Fixed point reached after {relaxations} relaxations: cost={opt._cost}')
 
         LOGGER.info('')
         LOGGER.info(f'Saving numbers to {args.filepath}')
         opt.save(args.filepath)
         LOGGER.info('')
 
+    PushNumber.load_numbers(args.filepath)
+
+    # Compute transition costs between numbers, for delta encoding of characters
+
+    if not args.show_only:
+        transitions_filepath = transition_costs_filepath(args.filepath)
+        LOGGER.info(f'Saving transition costs to {transitions_filepath}')
+        save_transition_costs(transitions_filepath, max_num=args.limit)
+        LOGGER.info('')
+
     # Print numbers
 
-    PushNumber.load_numbers(args.filepath)
     for n in range(1, args.limit + 1):
         num = PushNumber(n)
         LOGGER.info(f'{n} = {num.decomposition}')
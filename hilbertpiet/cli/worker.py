@@ -0,0 +1,156 @@
+import argparse
+import json
+import logging
+import os
+import socketserver
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, TextIO
+
+from hilbertpiet.cli.batch import parse_job, parse_json, run_job
+from hilbertpiet.encoding import ENCODINGS
+from hilbertpiet.pages import init_worker
+from hilbertpiet.path import load_path
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of Hilbert curve iterations up to which paths are generated on startup, by default
+WARM_ITERATIONS = 4
+
+
+def warm_up(numbers_filepath: Path, iterations: int = WARM_ITERATIONS):
+    """
+    Load numbers and transition costs, and generate the paths of up to a given number of
+    iterations, once for all requests.
+    """
+
+    init_worker(numbers_filepath)
+    for i in range(1, iterations + 1):
+        load_path(i)
+
+
+def handle_request(line: str, defaults: Dict) -> Dict:
+    """
+    Generate the image of a request: a JSON object with `text` (or `input` file) and `out` file,
+    optionally an `id`, echoed in the response, and any other attribute of
+    :class:`hilbertpiet.cli.batch.Job`, overriding defaults.
+
+    Returns:
+        The response to the request: its `id` and the result record of its job (see
+        :func:`hilbertpiet.cli.batch.run_job`).
+    """
+
+    try:
+        request = parse_json(line)
+    except ValueError as e:
+        return {'id': None, 'status': 'error', 'error': f'ValueError: {e}'}
+
+    request_id = request.pop('id', None)
+    try:
+        job = parse_job(dict(defaults, **request), Path.cwd())
+    except ValueError as e:
+        return {'id': request_id, 'status': 'error', 'error': f'ValueError: {e}'}
+
+    return dict(id=request_id, **run_job(job))
+
+
+def serve(requests: Iterable[str], responses: TextIO, defaults: Dict):
+    """
+    Serve line-delimited JSON requests (see :func:`handle_request`), writing one line-delimited
+    JSON response per request, in order. Blank lines are ignored.
+    """
+
+    for line in requests:
+        if not line.strip():
+            continue
+        response = handle_request(line, defaults)
+        responses.write(json.dumps(response) + '\n')
+        responses.flush()
+
+
+def serve_socket(socket_filepath: Path, defaults: Dict):
+    """
+    Serve line-delimited JSON requests (see :func:`serve`) over a Unix socket, each connection in
+    its own thread, until interrupted.
+    """
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            requests = (line.decode() for line in self.rfile)
+            responses = _SocketWriter(self.wfile)
+            serve(requests, responses, defaults)
+
+    with socketserver.ThreadingUnixStreamServer(str(socket_filepath), RequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            socket_filepath.unlink()
+
+
+class _SocketWriter:
+    """
+    Text file-like object writing into a socket.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text: str):
+        self.wfile.write(text.encode())
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def main():
+    description = ('Serve requests for Hilbert-curve-shaped Piet programs, as line-delimited '
+                   'JSON, from a resident process')
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--socket', '-s', type=Path,
+                        help='Unix socket file to listen on (default: serve stdin to stdout)')
+    parser.add_argument('--warm-iterations', type=int, default=WARM_ITERATIONS,
+                        help='generate paths up to this number of Hilbert curve iterations on '
+                             'startup (default: %(default)s)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='debug mode')
+    parser.add_argument('--codel-size', '-n', type=int, default=20,
+                        help='default output codel size (default: %(default)s)')
+    parser.add_argument('--initial-color', '-c', type=str, default='red',
+                        help='default initial color (default: %(default)s)')
+    parser.add_argument('--encoding', '-e', choices=list(ENCODINGS), default='plain',
+                        help='default character encoding (default: %(default)s)')
+    parser.add_argument('--no-run', action='store_true',
+                        help="don't run programs to check their output")
+    args = parser.parse_args()
+
+    if args.socket is not None and os.path.exists(args.socket):
+        parser.error(f'socket file already exists: {args.socket}')
+
+    # Setup logging (stdout is left to responses)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(message)s', stream=sys.stderr)
+
+    # Warm up
+
+    MODULE_ROOT: Path = Path(__file__).parent.parent
+    warm_up(MODULE_ROOT / 'data' / 'numbers.bin', args.warm_iterations)
+
+    defaults = dict(encoding=args.encoding, initial_color=args.initial_color,
+                    codel_size=args.codel_size, run=not args.no_run)
+
+    # Serve requests
+
+    if args.socket is None:
+        LOGGER.info('Ready, serving stdin')
+        serve(sys.stdin, sys.stdout, defaults)
+    else:
+        LOGGER.info(f'Ready, serving {args.socket}')
+        try:
+            serve_socket(args.socket, defaults)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from typing import List, Tuple
 
 
 @dataclass
@@ -58,6 +59,29 @@ class Color:
 
         return code
 
+    @property
+    def rgb(self) -> Tuple[int, int, int]:
+        """
+        RGB values of color (`(R, G, B)`).
+        """
+
+        code = self.code
+        return int(code[1:3], 16), int(code[3:5], 16), int(code[5:7], 16)
+
+    @property
+    def index(self) -> int:
+        """
+        Index of color in :meth:`palette`.
+        """
+        return self.lightness * 6 + self.hue
+
+    @classmethod
+    def palette(cls) -> List[Tuple[int, int, int]]:
+        """
+        RGB values of the 18 Piet colors, ordered by :attr:`index`.
+        """
+        return [cls(lightness, hue).rgb for lightness in range(3) for hue in range(6)]
+
     def __str__(self) -> str:
         """
         Human-readable name of color.
@@ -1,6 +1,12 @@
+import io
 from dataclasses import dataclass
 
-from typing import List
+from typing import List, TextIO
+
+# Position change of a single step in the direction of each dp, in the order of
+# `Context._DPS_VALUES`
+DPS_X = (1, 0, -1, 0)
+DPS_Y = (0, 1, 0, -1)
 
 
 @dataclass
@@ -11,45 +17,116 @@ class Context:
     Attributes:
         stack: program stack after previous codel
         value: size of previous codel, for push operation
-        position: position of next codel
-        dp: directional pointer; indicated the direction of the next codel
-        output: stdout of the program
+        x: x position of next codel
+        y: y position of next codel
+        dp_index: directional pointer, as an index of :attr:`_DPS_VALUES`; indicates the
+            direction of the next codel
+        sink: stdout of the program; an in-memory buffer by default, or any file-like object
+            (e.g. `sys.stdout`) to stream output as the program runs
+
+    Notes:
+        Position and directional pointer are stored as integers, so that they remain exact on
+        any canvas. They are also exposed as complex numbers (:attr:`position`, :attr:`dp`).
     """
 
     stack: List[int]
     value: int
-    position: complex
-    dp: complex
-    output: str
+    x: int
+    y: int
+    dp_index: int
+    sink: TextIO
+
+    __slots__ = ('stack', 'value', 'x', 'y', 'dp_index', 'sink')
 
     _DPS_VALUES = [1, 1j, -1, -1j]
     _DPS_STR = ['🡺', '🡻', '🡸', '🡹']
 
     def __init__(self, stack: List[int] = None, value: int = 0,
                  position: complex = 0j, dp: complex = 1,
-                 output: str = ''):
+                 output: str = '', sink: TextIO = None):
         self.stack = stack or []
         self.value = value
-        self.position = position
+        self.x, self.y = int(position.real), int(position.imag)
 
         if dp not in self._DPS_VALUES:
             raise ValueError(f'Invalid dp value: "{dp}"')
 
-        self.dp = dp
-        self.output = output
+        self.dp_index = self._DPS_VALUES.index(dp)
+
+        self.sink = io.StringIO() if sink is None else sink
+        if output:
+            self.sink.write(output)
+
+    @property
+    def output(self) -> str:
+        """
+        Stdout of the program, when written to an in-memory buffer.
+        """
+
+        try:
+            return self.sink.getvalue()
+        except AttributeError:
+            raise RuntimeError(f'Unbuffered output, written to {self.sink}')
+
+    @property
+    def position(self) -> complex:
+        """
+        Position of next codel (x as real part, y as imaginary part).
+        """
+        return complex(self.x, self.y)
+
+    @property
+    def dp(self) -> complex:
+        """
+        Directional pointer, as a unit complex number.
+        """
+        return self._DPS_VALUES[self.dp_index]
+
+    @property
+    def is_empty(self) -> bool:
+        """
+        Whether the context is the one of a program yet to be run.
+
+        Notes:
+            Unbuffered output is assumed to be empty.
+        """
+
+        output_written = self._is_buffered and self.output != ''
+
+        return (not self.stack and self.value == 0 and self.x == 0 and self.y == 0
+                and self.dp_index == 0 and not output_written)
 
     def update_position(self, steps: int):
         """
         Move position `steps` times in the direction of dp.
         """
-        self.position += steps * self.dp
+        self.x += steps * DPS_X[self.dp_index]
+        self.y += steps * DPS_Y[self.dp_index]
 
     def rotate_dp(self, steps: int):
         """
         Rotate directional pointer `steps` times by 90° clockwise.
         """
-        self.dp *= 1j ** steps
+        self.dp_index = (self.dp_index + steps) % 4
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        if self._is_buffered and other._is_buffered:
+            outputs_equal = self.output == other.output
+        else:
+            # Unbuffered outputs can't be read back: compare sinks
+            outputs_equal = self.sink is other.sink
+        return ((self.stack, self.value, self.x, self.y, self.dp_index) ==
+                (other.stack, other.value, other.x, other.y, other.dp_index) and outputs_equal)
+
+    @property
+    def _is_buffered(self) -> bool:
+        """
+        Whether output is written to an in-memory buffer (see :attr:`output`).
+        """
+        return hasattr(self.sink, 'getvalue')
 
     def __str__(self):
-        dp_str = self._DPS_STR[self._DPS_VALUES.index(self.dp)]
+        dp_str = self._DPS_STR[self.dp_index]
         return f'{self.stack} {self.value} {self.position} {dp_str}'
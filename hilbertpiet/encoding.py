@@ -0,0 +1,218 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from hilbertpiet.numbers import PushNumber
+from hilbertpiet.ops import Add, Duplicate, Op, OutChar, Pop, Roll, Substract
+
+# Cost of the operations reaching a character code from the previous one, kept on top of the
+# stack, indexed by (previous, next) character codes (see :func:`transition_ops`)
+_transition_costs = np.zeros((0, 0), dtype=np.uint16)
+
+
+def transition_costs_filepath(numbers_filepath: Path) -> Path:
+    """
+    File of the transition costs computed from a given file of numbers, next to it.
+    """
+    return numbers_filepath.with_suffix('.transitions.npy')
+
+
+def load_transition_costs(filepath: Path):
+    """
+    Load transition costs from a file.
+    """
+    global _transition_costs
+    _transition_costs = np.load(filepath)
+
+
+def save_transition_costs(filepath: Path, max_num: int):
+    """
+    Compute transition costs between all character codes up to a given one, with the currently
+    loaded numbers, and save them into a file.
+    """
+
+    # Same costs as the ones of `transition_ops`, for all pairs at once
+    nums = np.arange(max_num + 1)
+    push_costs = np.array([0] + [PushNumber(n).size for n in nums[1:]], dtype=np.uint16)
+    deltas = np.abs(nums[np.newaxis, :] - nums[:, np.newaxis])
+    costs = np.minimum(push_costs[deltas], push_costs[np.newaxis, :]) + 1
+    costs[deltas == 0] = 0
+
+    with filepath.open('wb') as f:
+        np.save(f, costs)
+
+
+def transition_ops(previous: int, next: int) -> List[Op]:
+    """
+    Operations replacing a character code on top of the stack with the next one: either add or
+    substract their difference, or pop the previous one and push the next one, whichever is
+    cheaper.
+    """
+
+    if previous == next:
+        return []
+
+    delta = next - previous
+    delta_ops = [PushNumber(abs(delta)), Add() if delta > 0 else Substract()]
+    push_ops = [Pop(), PushNumber(next)]
+
+    if sum(op.size for op in delta_ops) <= sum(op.size for op in push_ops):
+        return delta_ops
+    else:
+        return push_ops
+
+
+def transition_cost(previous: int, next: int) -> int:
+    """
+    Size of :func:`transition_ops`. Looked up in loaded transition costs, when available.
+    """
+
+    if previous < len(_transition_costs) and next < len(_transition_costs):
+        return int(_transition_costs[previous, next])
+    return sum(op.size for op in transition_ops(previous, next))
+
+
+def encode_plain(num_chars: Sequence[int]) -> List[Op]:
+    """
+    Encode characters as Piet operations that push each character code to the stack and dump it
+    back as character to stdout.
+    """
+
+    ops = []
+    for num_char in num_chars:
+        ops += [PushNumber(num_char), OutChar()]
+    return ops
+
+
+def encode_stack(num_chars: Sequence[int]) -> List[Op]:
+    """
+    Encode characters as Piet operations that dump them as characters to stdout, keeping the
+    character codes used again later on the stack.
+
+    Notes:
+        * Runs of a character are output by duplicating its code, one codel per repetition
+          (plus one for the output itself).
+        * The stack is a move-to-front list of character codes: a code `d` deep in the stack is
+          brought back on top with `d - 1` rolls to depth `d`.
+        * A character code is duplicated and kept on the stack after being output, only if
+          rolling it back on top for its next occurrence is cheaper than pushing it again. The
+          depth it will be at is bounded by the number of distinct characters in between.
+    """
+
+    # Index of the next occurrence of each character, after its current run
+    next_occurrences = [None] * len(num_chars)
+    last_occurrences = {}
+    for i in reversed(range(len(num_chars))):
+        num_char = num_chars[i]
+        if i + 1 < len(num_chars) and num_chars[i + 1] == num_char:
+            next_occurrences[i] = next_occurrences[i + 1]
+        else:
+            next_occurrences[i] = last_occurrences.get(num_char)
+        last_occurrences[num_char] = i
+
+    # Size of the operations rolling a value to the top of the stack, by depth
+    roll_sizes = {}
+
+    def roll_size(depth: int) -> int:
+        if depth not in roll_sizes:
+            roll_sizes[depth] = sum(op.size for op in _roll_to_top_ops(depth))
+        return roll_sizes[depth]
+
+    ops = []
+    # Character codes kept on the stack (top of the stack last)
+    stack = []
+
+    i = 0
+    while i < len(num_chars):
+        num_char = num_chars[i]
+
+        run_length = 1
+        while i + run_length < len(num_chars) and num_chars[i + run_length] == num_char:
+            run_length += 1
+
+        # Get character code on top of the stack
+
+        if num_char in stack:
+            depth = len(stack) - stack.index(num_char)
+            ops += _roll_to_top_ops(depth)
+            del stack[-depth]
+        else:
+            ops.append(PushNumber(num_char))
+
+        # Keep a copy of the character code, if worth it
+
+        keep = False
+        next_occurrence = next_occurrences[i]
+        if next_occurrence is not None:
+            push_size = PushNumber(num_char).size
+
+            distinct_num_chars = set()
+            for j in range(i + run_length, next_occurrence):
+                distinct_num_chars.add(num_chars[j])
+                if 1 + roll_size(len(distinct_num_chars) + 1) >= push_size:
+                    break
+            else:
+                keep = True
+
+        # Output character
+
+        ops += [Duplicate()] * (run_length - 1 + keep)
+        ops += [OutChar()] * run_length
+
+        if keep:
+            stack.append(num_char)
+
+        i += run_length
+
+    return ops
+
+
+def _roll_to_top_ops(depth: int) -> List[Op]:
+    """
+    Operations rolling the value at a given depth (1 being the top) of the stack to the top of the
+    stack.
+    """
+    return [PushNumber(depth), PushNumber(depth - 1), Roll()] if depth > 1 else []
+
+
+def encode_delta(num_chars: Sequence[int]) -> List[Op]:
+    """
+    Encode characters as Piet operations that dump them as characters to stdout, reaching each
+    character code from the previous one when it is kept on the stack.
+
+    Notes:
+        Keeping a character code on the stack costs a duplication before it is output, and only
+        affects how the next character code is produced. Hence the optimal choice is made for
+        each pair of consecutive characters on its own: keep the previous character code if
+        duplicating it and reaching the next one from it (see :func:`transition_cost`) is
+        cheaper than pushing the next one.
+    """
+
+    push_costs = {num_char: PushNumber(num_char).size for num_char in set(num_chars)}
+
+    # Whether to keep each character code on the stack, for the next one
+    kept = [1 + transition_cost(previous, next) < push_costs[next]
+            for previous, next in zip(num_chars, num_chars[1:])]
+    kept.append(False)
+
+    ops = []
+    for i, num_char in enumerate(num_chars):
+        if i > 0 and kept[i - 1]:
+            ops += transition_ops(num_chars[i - 1], num_char)
+        else:
+            ops.append(PushNumber(num_char))
+
+        if kept[i]:
+            ops.append(Duplicate())
+        ops.append(OutChar())
+
+    return ops
+
+
+# Available character encodings, by name
+ENCODINGS: Dict[str, Callable[[Sequence[int]], List[Op]]] = {
+    'plain': encode_plain,
+    'stack': encode_stack,
+    'delta': encode_delta
+}
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Hashable, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from hilbertpiet.color import Color
+from hilbertpiet.context import DPS_X, DPS_Y
+from hilbertpiet.macros import Macro
+from hilbertpiet.ops import Op, Pointer
+from hilbertpiet.path import UTurn, path_macro_key
+from hilbertpiet.png import write_png
+from hilbertpiet.run import PALETTE, Colorchange, Position, Program, render_codels
+from hilbertpiet.run import render_codels_frames, render_grid
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Output image formats rendered as one frame per initial color hue
+ANIMATED_FORMATS = ('.gif', '.apng', '.webp')
+
+# Position change of a single step, for each dp
+_DPS_X = np.array(DPS_X)
+_DPS_Y = np.array(DPS_Y)
+
+
+@dataclass(eq=False)
+class Layout:
+    """
+    Position and cumulative color change from first codel of the program, of each codel of a
+    program. Computed without running the program.
+
+    Attributes:
+        xs: x position of codels
+        ys: y position of codels
+        lightness_changes: cumulative lightness change of codels
+        hue_changes: cumulative hue change of codels
+    """
+
+    xs: np.ndarray
+    ys: np.ndarray
+    lightness_changes: np.ndarray
+    hue_changes: np.ndarray
+
+    @classmethod
+    def from_program(cls, program: Program) -> Layout:
+        """
+        Lay out the codels of a program.
+
+        Notes:
+            Codels positions only depend on operations sizes and dp rotations, and colors on
+            operations color changes. Stack is never involved, except for dp rotations:
+            the only pointer operations allowed are the ones of U-turns, whose rotations are
+            known in advance.
+        """
+
+        return cls.from_arrays(*_op_arrays(program.ops))
+
+    @classmethod
+    def iter_from_chunks(cls, chunks: Iterable[List[Op]]) -> Iterator[Layout]:
+        """
+        Lazily lay out the codels of a program given as consecutive non-empty chunks of
+        operations (the first one starting with the initial operation), yielding the layout of
+        each chunk.
+
+        Notes:
+            Only the current chunk is held in memory. Codels positions and color changes are the
+            ones of the whole program, as laid out by :meth:`from_program`.
+        """
+
+        x, y, dp_index, lightness_change, hue_change = 0, 0, 0, 0, 0
+
+        for chunk in chunks:
+            sizes, lightness_changes, hue_changes, dp_steps = _op_arrays(chunk)
+
+            yield cls.from_arrays(sizes, lightness_changes, hue_changes, dp_steps,
+                                  x=x, y=y, dp_index=dp_index,
+                                  lightness_change=lightness_change, hue_change=hue_change)
+
+            # Next chunk starts where this one ends
+            dps = (dp_index + np.cumsum(dp_steps)) % 4
+            x += int(np.sum(sizes * _DPS_X[dps]))
+            y += int(np.sum(sizes * _DPS_Y[dps]))
+            dp_index = int(dps[-1])
+            lightness_change += int(np.sum(lightness_changes))
+            hue_change += int(np.sum(hue_changes))
+
+    @classmethod
+    def from_arrays(cls, sizes: np.ndarray, lightness_changes: np.ndarray,
+                    hue_changes: np.ndarray, dp_steps: np.ndarray,
+                    x: int = 0, y: int = 0, dp_index: int = 0,
+                    lightness_change: int = 0, hue_change: int = 0) -> Layout:
+        """
+        Lay out codels given the size, color change and dp rotation of each operation, starting
+        from position `(0, 0)` with dp pointing right by default.
+
+        Args:
+            x: x position of the first operation
+            y: y position of the first operation
+            dp_index: directional pointer before the first operation, as an index of
+                :attr:`hilbertpiet.context.Context._DPS_VALUES`
+            lightness_change: cumulative lightness change before the first operation
+            hue_change: cumulative hue change before the first operation
+
+        Notes:
+            Memory and time scale with the number of operations, plus a vectorized expansion of
+            blocks of codels.
+        """
+
+        # Operations move forward in the direction of dp after it was rotated
+        dps = (dp_index + np.cumsum(dp_steps)) % 4
+        moves_x = sizes * _DPS_X[dps]
+        moves_y = sizes * _DPS_Y[dps]
+
+        # Operations start at the position reached by previous operations
+        xs = x + np.concatenate([[0], np.cumsum(moves_x)[:-1]])
+        ys = y + np.concatenate([[0], np.cumsum(moves_y)[:-1]])
+
+        lightness_changes = lightness_change + np.cumsum(lightness_changes)
+        hue_changes = hue_change + np.cumsum(hue_changes)
+
+        # Operations of size > 1 (i.e. blocks of `Extend`) span several codels in the direction
+        # of dp before it was rotated
+        if np.any(sizes != 1):
+            codel_ops = np.repeat(np.arange(len(sizes)), sizes)
+            steps = np.arange(len(codel_ops)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            codel_dps = (dps - dp_steps)[codel_ops] % 4
+
+            xs = xs[codel_ops] + steps * _DPS_X[codel_dps]
+            ys = ys[codel_ops] + steps * _DPS_Y[codel_dps]
+            lightness_changes = lightness_changes[codel_ops]
+            hue_changes = hue_changes[codel_ops]
+
+        return cls(xs, ys, lightness_changes, hue_changes)
+
+    @property
+    def codels(self) -> Dict[Position, Colorchange]:
+        """
+        Codels cumulative color change, indexed by position (like
+        :attr:`hilbertpiet.run.Program.codels`).
+        """
+
+        positions = zip(self.xs.tolist(), self.ys.tolist())
+        color_changes = zip(self.lightness_changes.tolist(), self.hue_changes.tolist())
+        return dict(zip(positions, color_changes))
+
+    def render(self, initial_color: str, codel_size: int) -> Image:
+        """
+        Render Piet codels.
+        """
+        return render_codels(self.xs, self.ys, self.lightness_changes, self.hue_changes,
+                             Color.from_name(initial_color), codel_size)
+
+    def render_frames(self, codel_size: int) -> List[Image]:
+        """
+        Render Piet codels once for each of the 6 hues of initial color, starting from red.
+        """
+        return render_codels_frames(self.xs, self.ys, self.lightness_changes, self.hue_changes,
+                                    codel_size)
+
+    def save(self, filepath: Path, initial_color: str, codel_size: int):
+        """
+        Render Piet codels into an image file. Animated formats (see :data:`ANIMATED_FORMATS`)
+        get one frame per initial color hue, and ignore `initial_color`. PNG images are indexed
+        (see :func:`hilbertpiet.png.write_png`).
+        """
+
+        if filepath.suffix in ANIMATED_FORMATS:
+            imgs = self.render_frames(codel_size=codel_size)
+            options = {}
+            if filepath.suffix != '.gif':
+                # Only GIF supports a distinct palette for each frame
+                imgs = [img.convert('RGB') for img in imgs]
+            if filepath.suffix == '.webp':
+                options['lossless'] = True
+            imgs[0].save(filepath, append_images=imgs[1:], duration=600, loop=0,
+                         save_all=True, optimize=False, **options)
+
+        elif filepath.suffix == '.png':
+            grid = render_grid(self.xs, self.ys, self.lightness_changes, self.hue_changes,
+                               Color.from_name(initial_color))
+            write_png(filepath, grid, PALETTE, codel_size)
+
+        else:
+            img = self.render(initial_color=initial_color, codel_size=codel_size)
+            img.save(filepath)
+
+
+def _op_arrays(ops: Iterable[Op]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Size, color change (in lightness and hue) and dp rotation of the primitive operations of
+    given operations, as arrays (see :meth:`Layout.from_arrays`).
+    """
+
+    sizes: List[int] = []
+    lightness_changes: List[int] = []
+    hue_changes: List[int] = []
+    dp_steps: List[int] = []
+
+    for op in ops:
+        key = path_macro_key(op)
+        if key is not None:
+            # U-turns and no-ops fill most of the codels of large paths: expand them once
+            try:
+                op_arrays = _path_macros_arrays[key]
+            except KeyError:
+                op_arrays = _path_macros_arrays[key] = _primitive_op_lists(op)
+        else:
+            op_arrays = _primitive_op_lists(op)
+
+        sizes += op_arrays[0]
+        lightness_changes += op_arrays[1]
+        hue_changes += op_arrays[2]
+        dp_steps += op_arrays[3]
+
+    return (np.array(sizes, dtype=np.int64), np.array(lightness_changes, dtype=np.int64),
+            np.array(hue_changes, dtype=np.int64), np.array(dp_steps, dtype=np.int64))
+
+
+# Lists of `_primitive_op_lists` of U-turns and no-ops, by `path_macro_key`
+_path_macros_arrays: Dict[Hashable, Tuple[List[int], List[int], List[int], List[int]]] = {}
+
+
+def _primitive_op_lists(op: Op) -> Tuple[List[int], List[int], List[int], List[int]]:
+    """
+    Size, color change (in lightness and hue) and dp rotation of the primitive operations of an
+    operation, as lists.
+    """
+
+    sizes, lightness_changes, hue_changes, dp_steps = [], [], [], []
+
+    steps = op.dp_steps if isinstance(op, UTurn) else None
+
+    for op in op.iter_ops() if isinstance(op, Macro) else [op]:
+        sizes.append(op.size)
+
+        color_change = op.color_change
+        lightness_changes.append(int(color_change.real))
+        hue_changes.append(int(color_change.imag))
+
+        if isinstance(op, Pointer):
+            if steps is None:
+                raise ValueError(f'Invalid stack-dependent operation for layout: "{op}"')
+            dp_steps.append(steps)
+        else:
+            dp_steps.append(0)
+
+    return sizes, lightness_changes, hue_changes, dp_steps
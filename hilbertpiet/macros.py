@@ -1,6 +1,6 @@
 import abc
 from dataclasses import dataclass
-from typing import List
+from typing import Iterator, List
 
 from hilbertpiet.context import Context
 from hilbertpiet.ops import Extend, Op
@@ -17,20 +17,25 @@ class Macro(Op):
             context = op(context)
         return context
 
-    @property
-    def expanded_ops(self) -> List[Op]:
+    def iter_ops(self) -> Iterator[Op]:
         """
-        Recursively get the primitive operations (of type :class:`hilbertpiet.ops.Op`)
-        represented by the macro.
+        Recursively and lazily yield the primitive operations (of type
+        :class:`hilbertpiet.ops.Op`) represented by the macro.
         """
 
-        expanded_ops = []
         for op in self.ops:
             if isinstance(op, Macro):
-                expanded_ops += op.expanded_ops
+                yield from op.iter_ops()
             else:
-                expanded_ops += [op]
-        return expanded_ops
+                yield op
+
+    @property
+    def expanded_ops(self) -> List[Op]:
+        """
+        Recursively get the primitive operations (of type :class:`hilbertpiet.ops.Op`)
+        represented by the macro.
+        """
+        return list(self.iter_ops())
 
     @property
     def size(self) -> int:
@@ -60,7 +65,12 @@ class Resize(Macro):
 
     @property
     def ops(self) -> List[Op]:
-        return [Extend() for _ in range(self.value - 1)]
+        # A single block of codels
+        return [Extend(self.value - 1)]
+
+    @property
+    def size(self) -> int:
+        return self.value - 1
 
     def __call__(self, context: Context) -> Context:
         if context.value != 1:
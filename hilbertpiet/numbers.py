@@ -1,15 +1,25 @@
 from __future__ import annotations
 
 import abc
+import mmap
 import operator
 import pickle
+import struct
 from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from math import log
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
 
 from hilbertpiet.macros import Macro, Resize
 from hilbertpiet.ops import Add, Divide, Duplicate, Multiply, Op, Push, Substract
 
+# Number of decompositions of numbers outside of the loaded set to keep in memory (see
+# `PushNumber._decompose`). Read once, at import.
+DECOMPOSITION_CACHE_SIZE = 4096
+
 
 @dataclass
 class PushNumber(Macro):
@@ -22,20 +32,111 @@ class PushNumber(Macro):
 
     n: int
 
-    # Tree representation of a given set of numbers
-    __trees = {}
+    # Tree representation of a given set of numbers, assumed to be a range starting from 1
+    __table = None
+    # Upper bound of the set of numbers
+    __max_n = 0
+    # Size of the tree of each number of the set, indexed by number (0 for the null number)
+    __sizes = np.zeros(1, dtype=np.int64)
+    # Numbers of the set the cheapest to decompose other numbers with, by average cost per digit
+    __bases = {}
+
+    # Number of bases to decompose numbers outside of the set with
+    N_BASES = 8
 
     @classmethod
     def load_numbers(cls, filepath: Path):
         """
-        Load tree representation of a set of numbers from a file.
+        Load tree representation of a set of numbers from a file: either a number table (see
+        :class:`NumberTable`), or a pickled dictionary of trees by number (legacy format, with a
+        `.pkl` suffix).
+
+        Notes:
+            Number tables are memory-mapped, and numbers decoded on first use: loading doesn't
+            depend on the number of numbers, only their costs are read.
         """
-        with filepath.open('rb') as f:
-            cls.__trees = pickle.load(f)
+
+        if filepath.suffix == '.pkl':
+            with filepath.open('rb') as f:
+                cls.__table = NumberTable.from_trees(pickle.load(f))
+        else:
+            cls.__table = NumberTable.load(filepath)
+
+        cls.__max_n = cls.__table.max_n
+        cls.__sizes = cls.__table.costs.astype(np.int64)
+        cls.__bases = cls.__find_bases()
+        cls._decompose.cache_clear()
 
     def __init__(self, n: int):
         self.n = n
-        self._tree = self.__trees.get(n, UnaryNumberTree(n))
+        table = self.__table
+        self._tree = table[n] if table is not None and n in table else self._decompose(n)
+
+    @classmethod
+    @lru_cache(maxsize=DECOMPOSITION_CACHE_SIZE)
+    def _decompose(cls, n: int) -> BaseNumberTree:
+        """
+        Tree representation of a number outside of the loaded set of numbers.
+
+        Notes:
+            The number is decomposed as `q * d + r`, with `d` and `r` in the set.
+
+            As long as `q` can be kept within the set, all such `d` are tried. Beyond, the best
+            bases are tried, `q` is assumed to cost the average cost per digit of the best base,
+            and only the most promising `q` is decomposed recursively. The number costs O(log n)
+            codels, and is decomposed in O(log n) time.
+        """
+
+        table, max_n = cls.__table, cls.__max_n
+
+        if n <= max_n or not cls.__bases:
+            return UnaryNumberTree(n)
+
+        sizes = cls.__sizes
+
+        if n <= max_n * max_n:
+            divisors = np.arange(max(2, n // (max_n + 1) + 1), max_n + 1)
+            qs, rs = np.divmod(n, divisors)
+            # The null remainder is free
+            costs = sizes[qs] + sizes[divisors] + 1 + sizes[rs] + (rs > 0)
+            best_d = int(divisors[np.argmin(costs)])
+        else:
+            # Numbers may not fit into arrays anymore
+            q_cost_per_log = min(cls.__bases.values())
+            costs = {}
+            for d in cls.__bases:
+                q, r = divmod(n, d)
+                costs[d] = q_cost_per_log * log(q) + sizes[d] + 1 + (sizes[r] + 1 if r else 0)
+            best_d = min(costs, key=costs.get)
+
+        q, r = divmod(n, best_d)
+        q_tree = table[q] if q <= max_n else cls._decompose(q)
+        d_tree = table[best_d]
+        r_tree = table[r] if r else None
+        tree = q_tree * d_tree
+        if r_tree is not None:
+            tree = tree + r_tree
+
+        return tree
+
+    @classmethod
+    def __find_bases(cls) -> Dict[int, float]:
+        """
+        Numbers of the loaded set with the lowest average cost per digit (normalized by the
+        logarithm of the base), when decomposing other numbers in their base.
+        """
+
+        sizes = cls.__sizes
+
+        scores = {}
+        remainders_cost = 0
+        for d in range(2, len(sizes)):
+            # Average cost of remainders, including the null one (for free)
+            remainders_cost += sizes[d - 1] + 1
+            scores[d] = float(sizes[d] + 1 + remainders_cost / d) / log(d)
+
+        bases = sorted(scores, key=scores.get)[:cls.N_BASES]
+        return {d: scores[d] for d in bases}
 
     @property
     def _cost(self) -> int:
@@ -51,6 +152,13 @@ class PushNumber(Macro):
         """
         return [self._tree]
 
+    def iter_ops(self) -> Iterator[Op]:
+        return self._tree.iter_ops()
+
+    @property
+    def size(self) -> int:
+        return self._tree.size
+
     @property
     def decomposition(self) -> str:
         """
@@ -83,6 +191,11 @@ class BaseNumberTree(Macro):
         """
         return self.size
 
+    @cached_property
+    def size(self) -> int:
+        # Trees are immutable: cache their size
+        return super().size
+
     def __add__(self, other: BaseNumberTree) -> BaseNumberTree:
         return AddNumberTree(self, other)
 
@@ -246,6 +359,206 @@ class PowNumberTree(BinaryNumberTree):
         ops += [Multiply() for _ in range(1, self.n2.n)]
         return ops
 
+    def iter_ops(self) -> Iterator[Op]:
+        yield from self.n1.iter_ops()
+        for _ in range(1, self.n2.n):
+            yield Duplicate()
+        for _ in range(1, self.n2.n):
+            yield Multiply()
+
+    @cached_property
+    def size(self) -> int:
+        return self.n1.size + 2 * (self.n2.n - 1)
+
     @property
     def _precedence(self) -> int:
         return 3
+
+
+# Opcodes of the postfix representation of number trees in number tables. Leaves and references
+# to other numbers of the table are followed by their number, as a variable-length integer.
+_ADD, _SUB, _MUL, _DIV, _POW, _LEAF, _REF = range(7)
+
+_BINARY_TREES = {_ADD: AddNumberTree, _SUB: SubNumberTree, _MUL: MultNumberTree,
+                 _DIV: DivNumberTree, _POW: PowNumberTree}
+_BINARY_OPCODES = {tree_class: opcode for opcode, tree_class in _BINARY_TREES.items()}
+
+
+class NumberTable:
+    """
+    Tree representation of a range of numbers starting from 1, along with their cost, stored as
+    compact arrays and decoded on first use.
+
+    Each number is stored as a postfix string of opcodes, referring to the other numbers of the
+    table its tree is made of. Tables are saved into binary files, which are memory-mapped when
+    loaded: processes loading the same file share it, and only decode the numbers they use.
+
+    Attributes:
+        costs: cost of each number, indexed by number (0 for the null number)
+        offsets: offset of the opcodes of each number (and of the end of the last one), indexed
+            by number
+        code: opcodes of all numbers
+    """
+
+    # File header: magic string, then upper bound of numbers and number of opcodes
+    MAGIC = b'PIETNUM1'
+    HEADER = struct.Struct('<8sII')
+
+    def __init__(self, costs: np.ndarray, offsets: np.ndarray, code: np.ndarray):
+        self.costs = costs
+        self.offsets = offsets
+        self.code = code
+        self._trees: Dict[int, BaseNumberTree] = {}
+
+    @property
+    def max_n(self) -> int:
+        """
+        Upper bound of the range of numbers.
+        """
+        return len(self.costs) - 1
+
+    def __contains__(self, n: int) -> bool:
+        return 1 <= n <= self.max_n
+
+    def __getitem__(self, n: int) -> BaseNumberTree:
+        """
+        Tree representation of a number of the table, decoded on first use.
+        """
+
+        tree = self._trees.get(n)
+        if tree is None:
+            if n not in self:
+                raise KeyError(n)
+            start, end = self.offsets[n], self.offsets[n + 1]
+            tree = self._trees[n] = self._decode(bytes(self.code[start:end]))
+        return tree
+
+    def _decode(self, code: bytes) -> BaseNumberTree:
+        """
+        Decode the postfix opcodes of a number into its tree.
+        """
+
+        stack = []
+        i = 0
+        while i < len(code):
+            opcode = code[i]
+            i += 1
+            if opcode in _BINARY_TREES:
+                n2 = stack.pop()
+                n1 = stack.pop()
+                stack.append(_BINARY_TREES[opcode](n1, n2))
+            else:
+                n, i = _decode_varint(code, i)
+                stack.append(UnaryNumberTree(n) if opcode == _LEAF else self[n])
+
+        tree, = stack
+        return tree
+
+    @classmethod
+    def from_trees(cls, trees: Dict[int, BaseNumberTree]) -> NumberTable:
+        """
+        Encode the tree representation of a range of numbers starting from 1.
+
+        Notes:
+            Subtrees of a number that are the very tree of another number of the table (as built
+            by the optimizer, or loaded from a pickled table) are encoded as references to it.
+        """
+
+        max_n = max(trees, default=0)
+        if any(n not in trees for n in range(1, max_n + 1)):
+            raise ValueError('Invalid set of numbers: not a range starting from 1')
+
+        costs = np.zeros(max_n + 1, dtype=np.uint32)
+        offsets = np.zeros(max_n + 2, dtype=np.uint32)
+        code = bytearray()
+
+        for n in range(1, max_n + 1):
+            costs[n] = trees[n].size
+            offsets[n] = len(code)
+            _encode_tree(trees[n], trees, code, root=True)
+        offsets[max_n + 1] = len(code)
+
+        table = cls(costs, offsets, np.frombuffer(bytes(code), dtype=np.uint8))
+        table._trees = dict(trees)
+        return table
+
+    @classmethod
+    def load(cls, filepath: Path) -> NumberTable:
+        """
+        Load a table from a file, memory-mapped.
+        """
+
+        with filepath.open('rb') as f:
+            header = f.read(cls.HEADER.size)
+            if len(header) < cls.HEADER.size or header[:len(cls.MAGIC)] != cls.MAGIC:
+                raise ValueError(f'Invalid numbers file: {filepath}')
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        _, max_n, code_size = cls.HEADER.unpack(header)
+
+        offset = cls.HEADER.size
+        costs = np.frombuffer(data, dtype='<u4', count=max_n + 1, offset=offset)
+        offset += costs.nbytes
+        offsets = np.frombuffer(data, dtype='<u4', count=max_n + 2, offset=offset)
+        offset += offsets.nbytes
+        code = np.frombuffer(data, dtype=np.uint8, count=code_size, offset=offset)
+
+        return cls(costs, offsets, code)
+
+    def save(self, filepath: Path):
+        """
+        Save the table into a file.
+        """
+
+        with filepath.open('wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.max_n, len(self.code)))
+            f.write(np.asarray(self.costs, dtype='<u4').tobytes())
+            f.write(np.asarray(self.offsets, dtype='<u4').tobytes())
+            f.write(np.asarray(self.code, dtype=np.uint8).tobytes())
+
+
+def _encode_tree(tree: BaseNumberTree, trees: Dict[int, BaseNumberTree], code: bytearray,
+                 root: bool = False):
+    """
+    Append the postfix opcodes of a number tree to a buffer.
+    """
+
+    if not root and trees.get(tree.n) is tree:
+        code.append(_REF)
+        _encode_varint(tree.n, code)
+    elif isinstance(tree, UnaryNumberTree):
+        code.append(_LEAF)
+        _encode_varint(tree.n, code)
+    else:
+        _encode_tree(tree.n1, trees, code)
+        _encode_tree(tree.n2, trees, code)
+        code.append(_BINARY_OPCODES[type(tree)])
+
+
+def _encode_varint(n: int, code: bytearray):
+    """
+    Append a non-negative integer to a buffer, 7 bits per byte, least significant bits first.
+    """
+
+    while n >= 0x80:
+        code.append(n & 0x7f | 0x80)
+        n >>= 7
+    code.append(n)
+
+
+def _decode_varint(code: bytes, i: int) -> Tuple[int, int]:
+    """
+    Decode a non-negative integer at a given offset of a buffer (see :func:`_encode_varint`).
+
+    Returns:
+        The integer, and the offset following it.
+    """
+
+    n = shift = 0
+    while True:
+        byte = code[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return n, i
@@ -1,6 +1,7 @@
 import abc
 import operator
 from dataclasses import dataclass, fields
+from typing import ClassVar, Dict
 
 from hilbertpiet.context import Context
 
@@ -9,8 +10,30 @@ from hilbertpiet.context import Context
 class Op:
     """
     A Piet operation. Identifies with a codel, most of the time.
+
+    Notes:
+        Classes of stateless primitive operations opt in to being flyweights, by setting
+        `_flyweight` to True: a single instance of each of them is shared. Subclasses don't inherit
+        it.
     """
 
+    __slots__ = ()
+
+    _flyweight: ClassVar[bool] = False
+
+    # Shared instance of each flyweight operation class
+    _flyweights: ClassVar[Dict[type, 'Op']] = {}
+
+    def __new__(cls, *args, **kwargs):
+        if not cls.__dict__.get('_flyweight', False):
+            return super().__new__(cls)
+
+        try:
+            return cls._flyweights[cls]
+        except KeyError:
+            instance = cls._flyweights[cls] = super().__new__(cls)
+            return instance
+
     def __call__(self, context: Context) -> Context:
 
         context = self._call(context)
@@ -66,8 +89,12 @@ class Init(Op):
         Requires input context to be empty, for good measure.
     """
 
+    __slots__ = ()
+
+    _flyweight = True
+
     def _call(self, context: Context) -> Context:
-        if context != Context():
+        if not context.is_empty:
             raise RuntimeError(f'Invalid non-empty context: "{context}"')
         return context
 
@@ -79,21 +106,37 @@ class Init(Op):
 @dataclass
 class Extend(Op):
     """
-    Increment the size of the previous codel and memorizes it as context value for the next
-    operation.
+    Increment the size of the previous codel by a given count of codels, and memorizes it as
+    context value for the next operation.
+
+    Attributes:
+        count: number of codels extending the previous one
 
     Notes:
         Not a real codel. Runtime knows how to handle it.
     """
 
+    count: int
+
+    __slots__ = ('count',)
+
+    def __init__(self, count: int = 1):
+        if count <= 0:
+            raise ValueError(f'Invalid non-positive extend count {count}')
+        self.count = count
+
     def _call(self, context: Context) -> Context:
-        context.value += 1
+        context.value += self.count
         return context
 
     @property
     def color_change(self) -> complex:
         return 0 + 0j
 
+    @property
+    def size(self):
+        return self.count
+
 
 @dataclass
 class Push(Op):
@@ -101,6 +144,10 @@ class Push(Op):
     Push the context value (i.e. the size of the previous codel) to the stack.
     """
 
+    __slots__ = ()
+
+    _flyweight = True
+
     def _call(self, context: Context) -> Context:
         if context.value <= 0:
             raise RuntimeError(f'Invalid non-positive push value {context.value}')
@@ -119,6 +166,10 @@ class Pop(Op):
     Pop the top value off the stack and discard it.
     """
 
+    __slots__ = ()
+
+    _flyweight = True
+
     def _call(self, context: Context) -> Context:
         context.stack.pop()
         return context
@@ -134,6 +185,10 @@ class Duplicate(Op):
     Pushes a copy of the top value on the stack on to the stack.
     """
 
+    __slots__ = ()
+
+    _flyweight = True
+
     def _call(self, context: Context) -> Context:
         x = context.stack.pop()
         context.stack.extend([x, x])
@@ -144,12 +199,46 @@ class Duplicate(Op):
         return 0 + 4j
 
 
+@dataclass
+class Roll(Op):
+    """
+    Pop the top two values off the stack and "roll" the remaining stack entries to a depth equal
+    to the second value popped, by a number of rolls equal to the first value popped.
+
+    A single roll to depth `n` buries the top value `n` deep, and brings all values above it up by
+    one position. A negative number of rolls rolls in the opposite direction.
+    """
+
+    __slots__ = ()
+
+    _flyweight = True
+
+    def _call(self, context: Context) -> Context:
+        stack = context.stack
+        rolls, depth = stack.pop(), stack.pop()
+
+        if not 0 <= depth <= len(stack):
+            raise RuntimeError(f'Invalid roll depth {depth} for stack of size {len(stack)}')
+
+        if depth and rolls % depth:
+            rolls %= depth
+            stack[-depth:] = stack[-rolls:] + stack[-depth:-rolls]
+
+        return context
+
+    @property
+    def color_change(self) -> complex:
+        return 1 + 4j
+
+
 @dataclass(eq=False)
 class BinaryOp(Op):
     """
     Convenience class for factorizing binary stack operations.
     """
 
+    __slots__ = ()
+
     binary_op = None
 
     def _call(self, context: Context) -> Context:
@@ -165,6 +254,11 @@ class Add(BinaryOp):
     """
     Pop the top two values off the stack, add them, and push the result back on the stack.
     """
+
+    __slots__ = ()
+
+    _flyweight = True
+
     binary_op = operator.add
 
     @property
@@ -178,6 +272,11 @@ class Substract(BinaryOp):
     Pop the top two values off the stack, calculate the second top value minus the top value,
     and push the result back on the stack.
     """
+
+    __slots__ = ()
+
+    _flyweight = True
+
     binary_op = operator.sub
 
     @property
@@ -190,6 +289,11 @@ class Multiply(BinaryOp):
     """
     Pop the top two values off the stack, multiply them, and push the result back on the stack.
     """
+
+    __slots__ = ()
+
+    _flyweight = True
+
     binary_op = operator.mul
 
     @property
@@ -203,6 +307,11 @@ class Divide(BinaryOp):
     Pop the top two values off the stack, calculate the integer division of the second top value
     by the top value, and push the result back on the stack.
     """
+
+    __slots__ = ()
+
+    _flyweight = True
+
     binary_op = operator.floordiv
 
     @property
@@ -217,6 +326,10 @@ class Pointer(Op):
     steps (anticlockwise if negative).
     """
 
+    __slots__ = ()
+
+    _flyweight = True
+
     def _call(self, context: Context) -> Context:
         context.rotate_dp(steps=context.stack.pop())
         return context
@@ -232,8 +345,12 @@ class OutNumber(Op):
     Pop the top value off the stack and append it to output as number.
     """
 
+    __slots__ = ()
+
+    _flyweight = True
+
     def _call(self, context: Context) -> Context:
-        context.output += f'{context.stack.pop()} '
+        context.sink.write(f'{context.stack.pop()} ')
         return context
 
     @property
@@ -247,8 +364,12 @@ class OutChar(Op):
     Pop the top value off the stack and append it to output as character.
     """
 
+    __slots__ = ()
+
+    _flyweight = True
+
     def _call(self, context: Context) -> Context:
-        context.output += chr(context.stack.pop())
+        context.sink.write(chr(context.stack.pop()))
         return context
 
     @property
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from hilbertpiet.encoding import ENCODINGS, load_transition_costs, transition_costs_filepath
+from hilbertpiet.layout import Layout
+from hilbertpiet.numbers import PushNumber
+from hilbertpiet.ops import Init, Op, OutChar
+from hilbertpiet.path import UNUSED_CODELS_PER_SLOT, NotEnoughSpace, Token, iter_map_program_to_path
+from hilbertpiet.path import load_path, map_program_to_smallest_path, path_capacity
+from hilbertpiet.run import Program
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Page:
+    """
+    A page of a long input: a chunk of its characters, printed by its own Piet program.
+
+    Attributes:
+        index: position of the page among pages, starting from 0
+        start: index of the first character of the page in the input
+        end: index of the character following the page in the input
+        image: image file of the program of the page
+        iterations: number of Hilbert curve iterations of the program
+        codels: number of codels of the program
+    """
+
+    index: int
+    start: int
+    end: int
+    image: Path
+    iterations: Optional[int] = None
+    codels: Optional[int] = None
+
+
+def split_pages(num_chars: Sequence[int], encode: Callable[[Sequence[int]], List[Op]],
+                iterations: int) -> List[Tuple[int, int]]:
+    """
+    Split characters into pages as large as possible, each printed by a program fitting into a
+    given number of Hilbert curve iterations.
+
+    Returns:
+        The start and end index of the characters of each page.
+
+    Notes:
+        Each character is output by a single `OutChar` operation. A chunk of characters larger
+        than a page is encoded, and the page first ends with the last character output within
+        the capacity of the path (see :func:`hilbertpiet.path.path_capacity`), less the codels
+        usually left unused by the mapping. The page is then encoded on its own and mapped to
+        the path, and ends with the last character mapped, until it fits.
+    """
+
+    if iterations < 1:
+        raise ValueError(f'Invalid number of iterations for pages: {iterations}')
+
+    path = load_path(iterations)
+    max_size = path_capacity(iterations, UNUSED_CODELS_PER_SLOT) + 1
+
+    # Characters cost at most the cost of the most expensive one to push, plus its output
+    max_char_cost = max((PushNumber(n).size + 1 for n in set(num_chars)), default=1)
+
+    pages = []
+    start, count = 0, 2 * max(1, max_size // max_char_cost)
+
+    while start < len(num_chars):
+
+        # Encode a chunk of characters larger than a page
+        while True:
+            count = min(count, len(num_chars) - start)
+            prefix_sizes = list(_iter_prefix_sizes(encode(num_chars[start:start + count])))
+            if prefix_sizes[-1] > max_size or start + count == len(num_chars):
+                break
+            count *= 2
+
+        page_count = max(1, bisect_right(prefix_sizes, max_size))
+
+        while True:
+            program = Program(encode(num_chars[start:start + page_count]))
+            mapped_count = _count_mapped_chars(program, path)
+            if mapped_count is None:
+                break
+            if mapped_count == 0:
+                raise ValueError(f'Invalid number of iterations for pages: {iterations}')
+            page_count = min(mapped_count, page_count - 1)
+
+        pages.append((start, start + page_count))
+        start += page_count
+        # Next chunk is likely a little larger than a page
+        count = page_count + page_count // 8 + 1
+
+    return pages
+
+
+def _iter_prefix_sizes(ops: List[Op]) -> Iterator[int]:
+    """
+    Size of the program made of operations encoding characters (initial operation included),
+    up to the output of each character.
+    """
+
+    size = Init().size
+    for op in ops:
+        size += op.size
+        if isinstance(op, OutChar):
+            yield size
+
+
+def _count_mapped_chars(program: Program, path: Sequence[Token]) -> Optional[int]:
+    """
+    Number of characters output by the operations of a program mapped to a path before running
+    out of space, `None` if the whole program fits into the path.
+    """
+
+    count = 0
+    try:
+        for op in iter_map_program_to_path(program, path):
+            if isinstance(op, OutChar):
+                count += 1
+    except NotEnoughSpace:
+        return count
+    return None
+
+
+def page_filepath(filepath: Path, index: int) -> Path:
+    """
+    Image file of a page, given the output image file of the whole input.
+    """
+    return filepath.with_name(f'{filepath.stem}-{index + 1:04d}{filepath.suffix}')
+
+
+def manifest_filepath(filepath: Path) -> Path:
+    """
+    Manifest file listing the pages, given the output image file of the whole input.
+    """
+    return filepath.with_suffix('.json')
+
+
+def init_worker(numbers_filepath: Path):
+    """
+    Load numbers and transition costs into a worker process, once for all of its jobs.
+    """
+    PushNumber.load_numbers(numbers_filepath)
+    load_transition_costs(transition_costs_filepath(numbers_filepath))
+
+
+def generate_page(page: Page, num_chars: Sequence[int], encoding: str, initial_color: str,
+                  codel_size: int, run: bool = True) -> Page:
+    """
+    Generate the program printing the characters of a page, and save its image.
+
+    Returns:
+        The page, along with the size of its program.
+    """
+
+    program = Program(ENCODINGS[encoding](num_chars))
+    program, iterations = map_program_to_smallest_path(program)
+
+    if run:
+        context = program.run(compiled=True)
+        if context.output != ''.join(map(chr, num_chars)):
+            raise RuntimeError(f'Program output of page {page.index + 1} differs from input')
+
+    Layout.from_program(program).save(page.image, initial_color=initial_color,
+                                      codel_size=codel_size)
+
+    page.iterations, page.codels = iterations, program.size
+    return page
+
+
+def generate_pages(num_chars: Sequence[int], filepath: Path, iterations: int, encoding: str,
+                   initial_color: str, codel_size: int, numbers_filepath: Path,
+                   run: bool = True, jobs: int = None) -> List[Page]:
+    """
+    Split characters into pages fitting into a given number of Hilbert curve iterations (see
+    :func:`split_pages`), generate the program and image of each page in a pool of processes,
+    and write a manifest listing the pages in order (see :func:`manifest_filepath`).
+
+    Args:
+        num_chars: character codes to print
+        filepath: output image file of the whole input, which page images are named after
+            (see :func:`page_filepath`)
+        iterations: number of Hilbert curve iterations of pages
+        encoding: character encoding (see :data:`hilbertpiet.encoding.ENCODINGS`)
+        initial_color: initial color of images
+        codel_size: output codel size
+        numbers_filepath: file of numbers, loaded once by each process
+        run: run the program of each page, to check its output
+        jobs: number of processes (default: number of CPUs)
+
+    Returns:
+        The pages, in order.
+    """
+
+    bounds = split_pages(num_chars, ENCODINGS[encoding], iterations)
+    pages = [Page(index, start, end, page_filepath(filepath, index))
+             for index, (start, end) in enumerate(bounds)]
+
+    LOGGER.info(f'{len(pages)} pages of {iterations} Hilbert curve iterations')
+
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), initializer=init_worker,
+                             initargs=(numbers_filepath,)) as executor:
+        futures = [executor.submit(generate_page, page, num_chars[page.start:page.end], encoding,
+                                   initial_color, codel_size, run)
+                   for page in pages]
+        pages = [future.result() for future in futures]
+
+    manifest = {
+        'encoding': encoding,
+        'iterations': iterations,
+        'characters': len(num_chars),
+        'pages': [dict(asdict(page), image=page.image.name) for page in pages]
+    }
+    with manifest_filepath(filepath).open('w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return pages
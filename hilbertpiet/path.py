@@ -1,12 +1,41 @@
 import abc
+import logging
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from collections import Counter
 from dataclasses import dataclass
-from typing import List, Literal, Union
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, Iterator, List, Literal, Optional, Tuple, Union
 
 from hilbertpiet.context import Context
 from hilbertpiet.macros import Macro, Resize
 from hilbertpiet.ops import Add, Duplicate, Extend, Op, Pointer, Pop, Push
 from hilbertpiet.run import Program
 
+LOGGER = logging.getLogger(__name__)
+
+# Path token: init, clockwise or anticlockwise U-turn, or a number of consecutive forwards
+Token = Union[Literal['I', 'C', 'A'], int]
+
+# Version of path generation, part of the key of cached paths. To be incremented whenever generated
+# paths change.
+PATH_VERSION = 1
+
+# Environment variable setting the directory of cached paths
+CACHE_DIR_ENV_VAR = 'HILBERTPIET_CACHE_DIR'
+
+# Path tokens encoded as integers, in cached paths (numbers of forwards encode as themselves)
+_TOKEN_CODES = {'I': 0, 'C': -1, 'A': -2}
+_CODE_TOKENS = {code: token for token, code in _TOKEN_CODES.items()}
+
+# Header of cached paths: magic, path version, iterations, number of tokens and CRC-32 of tokens
+_CACHE_MAGIC = b'PIETPATH'
+_CACHE_HEADER = struct.Struct('<8sIIII')
+
 
 @dataclass(eq=False)
 class UTurn(Macro):
@@ -30,6 +59,13 @@ class UTurn(Macro):
     def clockwise(self):
         raise NotImplementedError
 
+    @property
+    def dp_steps(self) -> int:
+        """
+        Steps by which each of the two pointer operations rotates dp (90° clockwise each).
+        """
+        return 1 if self.clockwise else 3
+
     def __call__(self, context: Context) -> Context:
 
         if context.value != 1:
@@ -112,6 +148,23 @@ class NoOp(Macro):
 
         return ops
 
+    @property
+    def size(self) -> int:
+        return self.length
+
+
+def path_macro_key(op: Op) -> Optional[Hashable]:
+    """
+    Key identifying the primitive operations of a U-turn or a no-op, which only depend on its
+    type and length: they may be expanded once and for all. `None` for any other operation.
+    """
+
+    if isinstance(op, UTurn):
+        return type(op)
+    if isinstance(op, NoOp):
+        return op.length
+    return None
+
 
 def _stretch_path(path: str) -> str:
     """
@@ -119,21 +172,72 @@ def _stretch_path(path: str) -> str:
     forwards.
     """
 
-    path += '$'
-    i = 0
-    stretched_path = ''
+    stretched_path = []
+    for n_forward, turn in _iter_forwards(iter(path)):
+        stretched_path.append('F' * _stretch_forwards(n_forward))
+        if turn is not None:
+            stretched_path.append(turn)
+
+    return ''.join(stretched_path)
+
+
+def _stretch_forwards(n_forward: int) -> int:
+    """
+    Number of consecutive forwards after stretching a given number of them (no forward at all
+    becomes 2 of them).
+    """
+    return n_forward * 5 + 2 if n_forward != 1 else 1
+
+
+def _iter_forwards(path: Iterator[str]) -> Iterator[Tuple[int, Optional[str]]]:
+    """
+    Lazily split a path into consecutive forwards, yielding their number along with the turn
+    following them (`None` for the last ones).
+    """
+
     n_forward = 0
-    while i < len(path):
-        c = path[i] if path[i] != '$' else ''
-        if c != 'F':
-            forwards = 'F' * (n_forward * 5 + 2) if n_forward != 1 else 'F'
-            stretched_path += forwards + c
-            n_forward = 0
-        else:
+    for c in path:
+        if c == 'F':
             n_forward += 1
-        i += 1
+        else:
+            yield n_forward, c
+            n_forward = 0
+
+    yield n_forward, None
+
+
+# L-system rules for Hilbert curve II
+_RULES = {'X': 'XFYFX+F+YFXFY-F-XFYFX', 'Y': 'YFXFY-F-XFYFX+F+YFXFY'}
+
+
+# Number of iterations up to which symbols are rewritten all at once (about 15k instructions)
+_EXPANDED_ITERATIONS = 4
+
+
+def _iter_l_system(symbol: str, iterations: int) -> Iterator[str]:
+    """
+    Lazily yield the turtle instructions (`F`, `+`, `-`) obtained by rewriting a symbol with the
+    L-system rules of Hilbert curve II a given number of times.
+    """
+
+    if iterations <= _EXPANDED_ITERATIONS:
+        yield from _expand_l_system(symbol, iterations)
+    else:
+        for c in _RULES.get(symbol, symbol):
+            yield from _iter_l_system(c, iterations - 1)
+
+
+@lru_cache(maxsize=None)
+def _expand_l_system(symbol: str, iterations: int) -> str:
+    """
+    Turtle instructions obtained by rewriting a symbol a given number of times, as a string.
+    """
 
-    return stretched_path
+    if symbol not in _RULES:
+        return symbol
+    if iterations <= 0:
+        return ''
+    return ''.join(_expand_l_system(c, iterations - 1) for c in _RULES[symbol])
 
 
 def generate_path(iterations: int) -> str:
@@ -146,19 +250,10 @@ def generate_path(iterations: int) -> str:
         https://elc.github.io/posts/plotting-fractals-step-by-step-with-python/#hilbert-curve-ii
     """
 
-    # L-system rules for Hilbert curve II
-    rules = {'X': 'XFYFX+F+YFXFY-F-XFYFX', 'Y': 'YFXFY-F-XFYFX+F+YFXFY'}
-    path = 'X'
-
     if iterations <= 0:
-        return path
-
-    for _ in range(iterations):
-        path = ''.join(rules.get(c, c) for c in path)
-
-    path = path.replace('X', '').replace('Y', '')
+        return 'X'
 
-    path = _stretch_path(path)
+    path = _stretch_path(''.join(_iter_l_system('X', iterations)))
 
     # Path is incomplete, for some reason
     path = 'F' + path + 'F'
@@ -230,11 +325,295 @@ def map_path_u_turns(path: str) -> List[Union[Literal['C', 'A'], int]]:
     return transformed_path
 
 
+def iter_path(iterations: int) -> Iterator[Token]:
+    """
+    Lazily yield the tokens of the path tracing a Hilbert curve II after a given number of
+    iterations, mapped to U-turns (equivalent to `map_path_u_turns(generate_path(iterations))`).
+
+    Notes:
+        The path is never held in memory: the L-system is expanded depth-first (the last
+        iterations from memoized strings of bounded size), and consecutive forwards are stretched
+        and mapped to U-turns as they come.
+    """
+
+    yield 'I'
+
+    if iterations <= 0:
+        return
+
+    # The first forward of the path is replaced by init. The last forward is added to the path.
+    forwards = _iter_forwards(_iter_l_system('X', iterations))
+    n_forward, turn = next(forwards)
+
+    while True:
+
+        n_forward = _stretch_forwards(n_forward)
+
+        if turn is None:
+            yield from _forwards_token(n_forward + 1)
+            return
+
+        # U-turn setup, then a turn, a single forward and the same turn
+        u_turn, setup_cost = _U_TURNS[turn]
+        next_n_forward, next_turn = next(forwards)
+        if n_forward < setup_cost or _stretch_forwards(next_n_forward) != 1 or next_turn != turn:
+            raise RuntimeError('Failed to replace all U-turns in path; '
+                               'put in more iterations or stretch it')
+
+        yield from _forwards_token(n_forward - setup_cost)
+        yield u_turn
+
+        n_forward, turn = next(forwards)
+
+
+# U-turn token and number of forwards required to set it up, for each turn
+_U_TURNS = {'+': ('C', 3), '-': ('A', 5)}
+
+
+def _forwards_token(n_forward: int) -> Iterator[int]:
+    """
+    Token of remaining consecutive forwards of a path, if any.
+    """
+
+    if n_forward == 1:
+        # No-ops (whose minimum length is 2) can't be mapped to single forwards.
+        raise RuntimeError('Generated single forwards in path; '
+                           'put in more iterations or stretch it')
+    if n_forward > 0:
+        yield n_forward
+
+
+@lru_cache(maxsize=8)
+def load_path(iterations: int) -> Tuple[Token, ...]:
+    """
+    Path tracing a Hilbert curve II after a given number of iterations, mapped to U-turns
+    (equivalent to `map_path_u_turns(generate_path(iterations))`).
+
+    Notes:
+        Paths are cached in memory, and on disk (as arrays of integers, after a checked header),
+        across runs and processes. Corrupted cached paths are generated again. Cache directory is
+        given by :data:`CACHE_DIR_ENV_VAR` environment variable, and defaults to the user cache
+        directory.
+    """
+
+    filepath = _cache_dir() / f'path-v{PATH_VERSION}-{iterations}.bin'
+
+    try:
+        codes = _read_cached_codes(filepath, iterations)
+    except OSError:
+        codes = None
+    if codes is not None:
+        return tuple(_CODE_TOKENS.get(code, code) for code in codes)
+
+    path = tuple(iter_path(iterations))
+
+    codes = array('i', (_TOKEN_CODES.get(token, token) for token in path))
+    data = codes.tobytes()
+    header = _CACHE_HEADER.pack(_CACHE_MAGIC, PATH_VERSION, iterations, len(codes),
+                                zlib.crc32(data))
+    temp_filepath = None
+    try:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        # Write file atomically, for concurrent processes never to read it partially written
+        with tempfile.NamedTemporaryFile(dir=filepath.parent, delete=False) as f:
+            temp_filepath = Path(f.name)
+            f.write(header + data)
+        os.replace(temp_filepath, filepath)
+    except OSError as e:
+        LOGGER.debug(f'Failed to cache path into {filepath}: {e}')
+        if temp_filepath is not None:
+            temp_filepath.unlink(missing_ok=True)
+
+    return path
+
+
+def clear_path_cache():
+    """
+    Clear paths, and the turtle instructions they are generated from, cached in memory. Paths
+    cached on disk are kept (see :func:`load_path`).
+    """
+
+    _expand_l_system.cache_clear()
+    load_path.cache_clear()
+
+
+def _read_cached_codes(filepath: Path, iterations: int) -> Optional[array]:
+    """
+    Read the tokens of a cached path, encoded as integers.
+
+    Returns:
+        The tokens, or None when the file is corrupted (or of another version).
+    """
+
+    content = filepath.read_bytes()
+    if len(content) < _CACHE_HEADER.size:
+        return None
+
+    magic, version, cached_iterations, size, crc = _CACHE_HEADER.unpack_from(content)
+    data = content[_CACHE_HEADER.size:]
+    if ((magic, version, cached_iterations) != (_CACHE_MAGIC, PATH_VERSION, iterations)
+            or len(data) != size * array('i').itemsize or zlib.crc32(data) != crc):
+        LOGGER.debug(f'Ignoring corrupted cached path {filepath}')
+        return None
+
+    return array('i', data)
+
+
+# Codels left unused in each slot of consecutive forwards on average, when mapping a program to a
+# path (the number of iterations it implies is right for more than 99% of programs)
+UNUSED_CODELS_PER_SLOT = 1
+
+
+@lru_cache(maxsize=None)
+def _slot_counts(iterations: int) -> Dict[int, int]:
+    """
+    Number of slots of consecutive forwards of a path, by number of forwards.
+
+    Notes:
+        Counts follow `c(n) = 9 * c(n - 1) + k` past the first iteration, the 9 copies of the
+        curve of the previous iteration being joined in the same way whatever the iteration.
+    """
+
+    if iterations <= 2:
+        return dict(Counter(token for token in iter_path(iterations) if isinstance(token, int)))
+
+    first_counts, second_counts = _slot_counts(1), _slot_counts(2)
+    counts = _slot_counts(iterations - 1)
+    return {size: 9 * counts[size] + second_counts[size] - 9 * first_counts.get(size, 0)
+            for size in second_counts}
+
+
+def path_size(iterations: int) -> int:
+    """
+    Number of codels of a program mapped to the path of a given number of iterations.
+    """
+
+    if iterations <= 0:
+        return 1
+
+    # As many clockwise U-turns as anticlockwise ones
+    n_u_turns = (9 ** iterations - 1) // 8
+    u_turns_size = n_u_turns * (UTurnClockwise().size + UTurnAntiClockwise().size)
+
+    return 1 + u_turns_size + path_capacity(iterations)
+
+
+def path_capacity(iterations: int, unused_codels_per_slot: int = 0) -> int:
+    """
+    Number of codels of the path of a given number of iterations, a program (except for the
+    initial operation) can be mapped to.
+
+    Args:
+        iterations: number of iterations of the path
+        unused_codels_per_slot: codels assumed to be left unused in each slot of consecutive
+            forwards, operations being impossible to split between slots (see
+            :data:`UNUSED_CODELS_PER_SLOT`). Capacity is an upper bound by default.
+    """
+    return sum((size - unused_codels_per_slot) * count
+               for size, count in _slot_counts(iterations).items())
+
+
+def path_dimensions(iterations: int) -> Tuple[int, int]:
+    """
+    Width and height (in codels) of the grid of a program mapped to the path of a given number
+    of iterations, termination codels included.
+    """
+
+    if iterations <= 0:
+        return 2, 2
+
+    return 15 * 3 ** (iterations - 1), 6 * 3 ** (iterations - 1)
+
+
+def select_iterations(size: int, unused_codels_per_slot: int = 0) -> int:
+    """
+    Smallest number of iterations of a path a program of a given number of codels may be mapped
+    to (see :func:`path_capacity`).
+
+    Notes:
+        By default, the program can't be mapped to fewer iterations, but may not fit into the
+        selected ones when it nearly fills them. It always fits into one more.
+    """
+
+    iterations = 0
+    while path_capacity(iterations, unused_codels_per_slot) < size - 1:
+        iterations += 1
+    return iterations
+
+
+def map_program_to_smallest_path(program: Program) -> Tuple[Program, int]:
+    """
+    Map a program to the path of the smallest number of iterations (at least one) it fits into.
+
+    Returns:
+        The mapped program, and the number of iterations of its path.
+    """
+
+    iterations = max(1, select_iterations(program.size))
+
+    while True:
+        try:
+            return map_program_to_path(program, load_path(iterations)), iterations
+        except NotEnoughSpace:
+            # Operations can't be split between slots of the path: the program may not fit into
+            # the smallest path large enough, but fits into a larger one, unless some of its
+            # operations fit into no slot at all
+            check_op_sizes(program)
+            LOGGER.debug(f"Program doesn't fit into {iterations} Hilbert curve iterations")
+            iterations += 1
+
+
+def check_op_sizes(program: Program):
+    """
+    Check that every operation of a program fits into some slot of consecutive forwards of a
+    path, i.e. that the program may be mapped to a path of enough iterations.
+
+    Notes:
+        Paths of 2 iterations or more all have slots of the same sizes. `Extend` operations and
+        the operation following them can't be split between slots.
+
+    Raises:
+        NotEnoughSpace: an operation fits into no slot, whatever the number of iterations
+    """
+
+    slot_sizes = list(_slot_counts(2))
+
+    # Size of the operations that can't be split between slots, so far
+    size = 0
+
+    ops = program.iter_ops()
+    # Skip initial operation
+    next(ops)
+
+    for op in ops:
+        size += op.size
+        if isinstance(op, Extend):
+            continue
+
+        # Slots are filled with no-ops, and `NoOp(1)` is illegal
+        if not any(size == slot_size or size <= slot_size - 2 for slot_size in slot_sizes):
+            raise NotEnoughSpace(f'Not enough space in any path; {size} codels of operations '
+                                 f'fit into no slot')
+        size = 0
+
+
+def _cache_dir() -> Path:
+    """
+    Directory of cached paths.
+    """
+
+    if CACHE_DIR_ENV_VAR in os.environ:
+        return Path(os.environ[CACHE_DIR_ENV_VAR])
+
+    user_cache_dir = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(user_cache_dir) / 'hilbertpiet'
+
+
 class NotEnoughSpace(Exception):
     pass
 
 
-def map_program_to_path(program: Program, path: List[Union[Literal['C', 'A'], int]]) -> Program:
+def map_program_to_path(program: Program, path: Iterable[Union[Literal['C', 'A'], int]]) -> Program:
     """
     Map a program (list of ops/macros) to empty slots in a path. Fill in the blanks with no-ops.
 
@@ -244,51 +623,72 @@ def map_program_to_path(program: Program, path: List[Union[Literal['C', 'A'], in
 
     Crash if path doesn't have enough space to accomodate the operations.
     """
+    return Program(list(iter_map_program_to_path(program, path)))
+
+
+def iter_map_program_to_path(program: Program,
+                             path: Iterable[Union[Literal['C', 'A'], int]]) -> Iterator[Op]:
+    """
+    Lazily map a program to empty slots in a path, like :func:`map_program_to_path`, yielding the
+    operations of the mapped program (except for the initial one) one slot after another.
+
+    Notes:
+        The program is expanded as a stream of primitive operations. Only the operations of the
+        current slot are held in memory.
+    """
 
-    ops = program.expanded_ops
+    ops = program.iter_ops()
+    # Skip initial operation
+    next(ops)
 
-    mapped_ops = []
-    i_path, i_ops = 1, 1
+    # Operations taken from the program, but left for the next slots (last one comes first)
+    carried_ops = []
 
-    while i_path < len(path):
+    def next_op() -> Optional[Op]:
+        return carried_ops.pop() if carried_ops else next(ops, None)
 
-        token = path[i_path]
+    tokens = iter(path)
+    # Skip init
+    next(tokens)
+
+    for token in tokens:
 
         if token in ('C', 'A'):
             uturn_ops = {'C': UTurnClockwise(), 'A': UTurnAntiClockwise()}
             op = uturn_ops[token]
-            mapped_ops.append(op)
+            yield op
 
         elif isinstance(token, int):
             available_size = token
+            slot_ops = []
 
             # Fill as many operation as possible in slot
-            while i_ops < len(ops) and ops[i_ops].size <= available_size:
-                mapped_ops.append(ops[i_ops])
-                available_size -= ops[i_ops].size
-                i_ops += 1
+            op = next_op()
+            while op is not None and op.size <= available_size:
+                slot_ops.append(op)
+                available_size -= op.size
+                op = next_op()
+            if op is not None:
+                carried_ops.append(op)
 
             # It is illegal to place a `Extend` operation before a no-op or U-turn.
             # `NoOp(1)` is illegal.
-            while mapped_ops and isinstance(mapped_ops[-1], Extend) or available_size == 1:
+            while slot_ops and isinstance(slot_ops[-1], Extend) or available_size == 1:
                 # Remove last operation from slot
-                available_size += mapped_ops.pop().size
-                i_ops -= 1
+                op = slot_ops.pop()
+                available_size += op.size
+                carried_ops.append(op)
+
+            yield from slot_ops
 
             # Fill blanks in slot with no-ops
             if available_size > 0:
                 assert available_size > 1
-                mapped_ops.append(NoOp(available_size))
+                yield NoOp(available_size)
 
         else:
             raise NotImplementedError
 
-        i_path += 1
-
-    if i_ops < len(ops):
-        remaining = len(ops) - i_ops
+    remaining = len(carried_ops) + sum(1 for _ in ops)
+    if remaining:
         raise NotEnoughSpace(f'Not enough space in path; {remaining} remaining operations')
-
-    mapped_program = Program(mapped_ops)
-
-    return mapped_program
@@ -0,0 +1,59 @@
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# Number of pixels compressed at once, at most (unless a single row of codels spans more)
+PIXELS_PER_WRITE = 2 ** 24
+
+
+def write_png(filepath: Path, grid: np.ndarray, palette: np.ndarray, codel_size: int):
+    """
+    Write a grid of palette indices (one cell per codel) as an indexed PNG image, upscaling
+    codels to `codel_size` pixels (nearest neighbour).
+
+    Notes:
+        Unlike rendering with PIL, the image is never held in memory: pixels are upscaled,
+        compressed and written a few rows at a time (see :data:`PIXELS_PER_WRITE`). The grid
+        may be memory-mapped.
+    """
+
+    height, width = grid.shape
+    if len(palette) > 256:
+        raise ValueError(f'Invalid palette of {len(palette)} colors for an indexed image')
+
+    compressor = zlib.compressobj()
+
+    with filepath.open('wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        # 8 bits per pixel, indexed colors, no interlacing
+        _write_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width * codel_size,
+                                             height * codel_size, 8, 3, 0, 0, 0))
+        _write_chunk(f, b'PLTE', np.asarray(palette, dtype=np.uint8).tobytes())
+
+        codel_rows = max(1, PIXELS_PER_WRITE // (width * codel_size ** 2))
+        for y in range(0, height, codel_rows):
+            pixels = np.repeat(np.repeat(grid[y:y + codel_rows], codel_size, axis=1),
+                               codel_size, axis=0)
+
+            # Each row of pixels starts with its filter type (none)
+            rows = np.zeros((len(pixels), pixels.shape[1] + 1), dtype=np.uint8)
+            rows[:, 1:] = pixels
+
+            data = compressor.compress(rows.tobytes())
+            if data:
+                _write_chunk(f, b'IDAT', data)
+
+        _write_chunk(f, b'IDAT', compressor.flush())
+        _write_chunk(f, b'IEND', b'')
+
+
+def _write_chunk(f, chunk_type: bytes, data: bytes):
+    """
+    Write a PNG chunk: length, type, data and checksum.
+    """
+    f.write(struct.pack('>I', len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
@@ -1,13 +1,20 @@
+from __future__ import annotations
+
 import logging
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, TextIO, Tuple
 
-from PIL import Image, ImageDraw
+import numpy as np
 
 from hilbertpiet.color import Color
-from hilbertpiet.context import Context
+from hilbertpiet.context import DPS_X, DPS_Y, Context
 from hilbertpiet.macros import Macro
 from hilbertpiet.ops import Init, Op
+from hilbertpiet.vm import Bytecode
+
+if TYPE_CHECKING:
+    # PIL is slow to import: it is only imported once rendering images
+    from PIL import Image
 
 LOGGER = logging.getLogger(__name__)
 
@@ -17,6 +24,21 @@ Position = Tuple[int, int]
 # (lightness_change, hue_change) color change
 Colorchange = Tuple[int, int]
 
+# RGB lookup table of rendered codels: the 18 Piet colors (indexed by `Color.index`), then white
+# and black
+PALETTE = np.array(Color.palette() + [(255, 255, 255), (0, 0, 0)], dtype=np.uint8)
+WHITE_INDEX, BLACK_INDEX = 18, 19
+
+
+def _rotate_hues(hue_change: int) -> np.ndarray:
+    """
+    :data:`PALETTE` indices shifted by a given hue change (white and black left untouched).
+    """
+
+    indices = [Color(lightness, hue + hue_change).index
+               for lightness in range(3) for hue in range(6)]
+    return np.array(indices + [WHITE_INDEX, BLACK_INDEX])
+
 
 @dataclass(eq=False)
 class Program(Macro):
@@ -35,43 +57,60 @@ class Program(Macro):
     def ops(self):
         return [Init()] + self._ops
 
-    def run(self) -> Context:
+    def run(self, compiled: bool = False, sink: TextIO = None) -> Context:
         """
         Run program and log result.
+
+        Args:
+            compiled: run program on the flat opcode virtual machine
+                (:class:`hilbertpiet.vm.Bytecode`) rather than with the reference interpreter.
+                Much faster, but operations are neither checked by macros nor logged.
+            sink: file-like object to stream program output to, as it runs (default: in-memory
+                buffer, see :attr:`hilbertpiet.context.Context.output`)
         """
 
-        context = Context()
+        if compiled:
+            context, self.codels = Bytecode.compile(self).run(sink=sink)
+            return context
+
+        context = Context(sink=sink)
         self.codels = {}
         previous_color_change = 0 + 0j
 
+        # Don't even format log messages when they are discarded
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+
         for op in self.ops:
 
             # Handle macro expansion
             ops = [op]
             indent = 0
             if isinstance(op, Macro):
-                LOGGER.debug(str(op))
+                if debug:
+                    LOGGER.debug(str(op))
                 indent = 2
-                ops = op.expanded_ops
+                ops = op.iter_ops()
 
             for op in ops:
                 # Update codels
 
-                x, y = (int(context.position.real),
-                        int(context.position.imag))
-
                 cum_color_change = previous_color_change + op.color_change
                 lightness_change, hue_change = (int(cum_color_change.real),
                                                 int(cum_color_change.imag))
                 previous_color_change = cum_color_change
 
-                self.codels[(x, y)] = (lightness_change, hue_change)
+                # Operations of size > 1 (i.e. blocks of `Extend`) span several codels
+                dx, dy = DPS_X[context.dp_index], DPS_Y[context.dp_index]
+                for step in range(op.size):
+                    x, y = context.x + step * dx, context.y + step * dy
+                    self.codels[(x, y)] = (lightness_change, hue_change)
 
                 # Execute operation
                 context = op(context)
 
                 # Log operation execution
-                LOGGER.debug(f"{' ' * indent}{op} {context}")
+                if debug:
+                    LOGGER.debug(f"{' ' * indent}{op} {context}")
 
         return context
 
@@ -79,75 +118,153 @@ class Program(Macro):
         """
         Render Piet codels.
         """
+        return render_codels(*self._codel_arrays(), Color.from_name(initial_color), codel_size)
+
+    def render_frames(self, codel_size: int) -> List[Image]:
+        """
+        Render Piet codels once for each of the 6 hues of initial color, starting from red.
+        """
+        return render_codels_frames(*self._codel_arrays(), codel_size)
+
+    def _codel_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Codels x and y positions, lightness and hue changes, as arrays.
+        """
 
         # Make sure program was run
         if not self.codels:
             raise RuntimeError("Can't render program; run it first")
 
-        # Image size
+        positions = np.array(list(self.codels.keys()), dtype=np.int64)
+        color_changes = np.array(list(self.codels.values()), dtype=np.int64)
 
-        last_x, last_y = max(self.codels.keys())
-        # Because codels indices start at 0
-        img_size = (last_x + 1, last_y + 1)
-        # For additional termination codels
-        img_size = (img_size[0] + 1, img_size[1] + 1)
-        # Take codel size into account
-        img_size = (img_size[0] * codel_size, img_size[1] * codel_size)
+        return positions[:, 0], positions[:, 1], color_changes[:, 0], color_changes[:, 1]
 
-        # Create image
 
-        img = Image.new('RGB', img_size, color='white')
+def render_codels(xs: np.ndarray, ys: np.ndarray,
+                  lightness_changes: np.ndarray, hue_changes: np.ndarray,
+                  initial_color: Color, codel_size: int) -> Image:
+    """
+    Render Piet codels, given their positions and cumulative color changes from first codel of
+    the program.
+    """
 
-        # Render codels
+    from PIL import Image
 
-        initial_color = Color.from_name(initial_color)
+    grid = render_grid(xs, ys, lightness_changes, hue_changes, initial_color)
 
-        for (x, y), (lightness_change, hue_change) in self.codels.items():
-            color = Color(initial_color.lightness + lightness_change,
-                          initial_color.hue + hue_change)
+    # Map codels to RGB values, then upscale them to pixels (nearest neighbour)
+    img = Image.fromarray(PALETTE[grid])
+    height, width = grid.shape
+    img = img.resize((width * codel_size, height * codel_size), Image.NEAREST)
 
-            self.__render_codel(img, x, y, codel_size, color.code)
+    return img
 
-        # Render termination codels
 
-        self.__render_termination_codels(img, last_x, last_y, codel_size, initial_color)
+def render_codels_frames(xs: np.ndarray, ys: np.ndarray,
+                         lightness_changes: np.ndarray, hue_changes: np.ndarray,
+                         codel_size: int) -> List[Image]:
+    """
+    Render Piet codels once for each of the 6 hues of initial color, starting from red.
 
-        return img
+    Notes:
+        Codels are rasterized only once, as an indexed ("P" mode) image. Frames share its pixels
+        and only differ in their palette, rotated by one hue from a frame to the next.
+    """
 
-    def __render_termination_codels(self, img: Image, last_x: int, last_y: int, codel_size: int,
-                                    initial_color: Color):
-        """
-        Render termination codels.
-        """
+    from PIL import Image
 
-        # Perform a last push
+    grid = render_grid(xs, ys, lightness_changes, hue_changes, Color.from_name('red'))
 
-        last_lightness_change, last_hue_change = self.codels[(last_x, last_y)]
-        termination_color = Color(initial_color.lightness + last_lightness_change + 1,
-                                  initial_color.hue + last_hue_change)
-        self.__render_codel(img, last_x + 1, last_y, codel_size, termination_color.code)
-        self.__render_codel(img, last_x + 1, last_y - 1, codel_size, termination_color.code)
-        self.__render_codel(img, last_x + 1, last_y + 1, codel_size, termination_color.code)
+    img = Image.fromarray(grid)
+    height, width = grid.shape
+    img = img.resize((width * codel_size, height * codel_size), Image.NEAREST)
 
-        # Add required black codels
+    frames = []
+    for hue in range(6):
+        frame = img.copy()
+        frame.putpalette(PALETTE[_rotate_hues(hue)].tobytes())
+        frames.append(frame)
 
-        black_color_code = '#000000'
-        self.__render_codel(img, last_x, last_y - 1, codel_size, black_color_code)
-        self.__render_codel(img, last_x, last_y + 1, codel_size, black_color_code)
-        self.__render_codel(img, last_x + 1, last_y - 2, codel_size, black_color_code)
+    return frames
 
-    @staticmethod
-    def __render_codel(img: Image, x: int, y: int, codel_size: int, color_code: str):
-        """
-        Render a given codel.
-        """
 
-        draw = ImageDraw.Draw(img)
+def render_grid(xs: np.ndarray, ys: np.ndarray,
+                lightness_changes: np.ndarray, hue_changes: np.ndarray,
+                initial_color: Color) -> np.ndarray:
+    """
+    Render Piet codels as a grid of :data:`PALETTE` indices (one cell per codel).
+    """
 
-        # Codel bounding box
-        corner1 = (x * codel_size, y * codel_size)
-        corner2 = (corner1[0] + codel_size - 1, corner1[1] + codel_size - 1)
-        codel_bounding_box = (corner1, corner2)
+    last_codel = last_codel_index(xs, ys)
+    last_x, last_y = int(xs[last_codel]), int(ys[last_codel])
+
+    # Image size
+
+    # Because codels indices start at 0, and for additional termination codels
+    width, height = last_x + 2, last_y + 2
+
+    grid = np.full((height, width), WHITE_INDEX, dtype=np.uint8)
+
+    render_codels_into(grid, xs, ys, lightness_changes, hue_changes, initial_color)
+    render_termination_codels(grid, last_x, last_y, int(lightness_changes[last_codel]),
+                              int(hue_changes[last_codel]), initial_color)
+
+    return grid
+
+
+def last_codel_index(xs: np.ndarray, ys: np.ndarray) -> int:
+    """
+    Index of the last codel, in (x, y) order, given codels positions.
+    """
+
+    last_codels = np.flatnonzero(xs == xs.max())
+    last_codels = last_codels[ys[last_codels] == ys[last_codels].max()]
+    return int(last_codels[-1])
+
+
+def render_codels_into(grid: np.ndarray, xs: np.ndarray, ys: np.ndarray,
+                       lightness_changes: np.ndarray, hue_changes: np.ndarray,
+                       initial_color: Color):
+    """
+    Render Piet codels into an existing grid of :data:`PALETTE` indices (one cell per codel).
+    Codels outside of the grid are clipped.
+    """
+
+    height, width = grid.shape
+
+    indices = ((initial_color.lightness + lightness_changes) % 3) * 6
+    indices += (initial_color.hue + hue_changes) % 6
+
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    grid[ys[inside], xs[inside]] = indices[inside]
+
+
+def render_termination_codels(grid: np.ndarray, last_x: int, last_y: int,
+                              lightness_change: int, hue_change: int, initial_color: Color):
+    """
+    Render the codels terminating a program into a grid of :data:`PALETTE` indices, given the
+    position and cumulative color change of the last codel of the program.
+    """
+
+    # Perform a last push
+    termination_color = Color(initial_color.lightness + lightness_change + 1,
+                              initial_color.hue + hue_change)
+    _render_codel(grid, last_x + 1, last_y, termination_color.index)
+    _render_codel(grid, last_x + 1, last_y - 1, termination_color.index)
+    _render_codel(grid, last_x + 1, last_y + 1, termination_color.index)
+
+    # Add required black codels
+    _render_codel(grid, last_x, last_y - 1, BLACK_INDEX)
+    _render_codel(grid, last_x, last_y + 1, BLACK_INDEX)
+    _render_codel(grid, last_x + 1, last_y - 2, BLACK_INDEX)
+
+
+def _render_codel(grid: np.ndarray, x: int, y: int, index: int):
+    """
+    Render a given codel, unless it lies outside of the grid.
+    """
 
-        # Draw codel
-        draw.rectangle(codel_bounding_box, color_code)
+    height, width = grid.shape
+    if 0 <= x < width and 0 <= y < height:
+        grid[y, x] = index
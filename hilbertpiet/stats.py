@@ -0,0 +1,79 @@
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, TextIO
+
+
+class Stats:
+    """
+    Statistics of a run of the script: wall time, CPU time and peak memory of each of its stages,
+    along with figures about its program and image.
+
+    Attributes:
+        trace_memory: trace Python memory allocations (numpy arrays included), to report the peak
+            memory of each stage. Tracing slows down allocations.
+        stages: statistics of each stage, by stage name, in order
+        figures: other statistics, by name
+
+    Notes:
+        The peak memory of a stage includes the memory still allocated by former stages, and its
+        peak resident set size is the peak of the process so far.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, Dict] = {}
+        self.figures: Dict = {}
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Record the statistics of a stage, run within the context.
+        """
+
+        if self.trace_memory and hasattr(tracemalloc, 'reset_peak'):
+            # Before Python 3.9, the peak is the one since tracing started
+            tracemalloc.reset_peak()
+
+        wall_time, cpu_time = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stats = {'wall_time': round(time.perf_counter() - wall_time, 6),
+                     'cpu_time': round(time.process_time() - cpu_time, 6)}
+            if self.trace_memory:
+                stats['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            stats['peak_rss'] = _peak_rss()
+            self.stages[name] = stats
+
+    def update(self, **figures):
+        """
+        Record other statistics.
+        """
+        self.figures.update(figures)
+
+    def to_dict(self) -> Dict:
+        return dict(self.figures, stages=self.stages)
+
+    def write(self, f: TextIO):
+        """
+        Write statistics as a JSON line.
+        """
+        f.write(json.dumps(self.to_dict()) + '\n')
+        f.flush()
+
+
+def _peak_rss() -> int:
+    """
+    Peak resident set size of the process, in bytes.
+    """
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes, except on macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
@@ -0,0 +1,213 @@
+import logging
+import tempfile
+from array import array
+from functools import cached_property
+from itertools import chain, islice
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+import numpy as np
+
+from hilbertpiet.color import Color
+from hilbertpiet.context import Context
+from hilbertpiet.layout import Layout
+from hilbertpiet.macros import Macro
+from hilbertpiet.ops import Init, Op
+from hilbertpiet.path import NotEnoughSpace, iter_map_program_to_path, iter_path, path_dimensions
+from hilbertpiet.path import path_macro_key
+from hilbertpiet.png import write_png
+from hilbertpiet.run import PALETTE, WHITE_INDEX, Program, render_codels_into
+from hilbertpiet.run import last_codel_index, render_termination_codels
+from hilbertpiet.vm import Bytecode
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of characters encoded at once, and of operations mapped, run and rendered at once (a
+# chunk of no-ops spans about 10 codels per operation)
+CHUNK_SIZE = 2 ** 14
+
+
+class ChunkedProgram(Program):
+    """
+    A Piet program printing characters, whose operations are encoded chunk of characters by
+    chunk of characters on demand, rather than held in memory.
+
+    Attributes:
+        num_chars: character codes to print
+        encode: character encoding (see :data:`hilbertpiet.encoding.ENCODINGS`)
+        chunk_size: number of characters encoded at once
+
+    Notes:
+        Each chunk is encoded on its own: encodings start from an empty stack, and leave it
+        empty. Encodings keeping character codes on the stack lose a little on chunk boundaries.
+    """
+
+    def __init__(self, num_chars: Sequence[int], encode: Callable[[Sequence[int]], List[Op]],
+                 chunk_size: int = CHUNK_SIZE):
+        super().__init__([])
+        self.num_chars = num_chars
+        self.encode = encode
+        self.chunk_size = chunk_size
+
+    def iter_chunks(self) -> Iterator[List[Op]]:
+        """
+        Lazily encode characters, yielding the operations of each chunk of characters.
+        """
+        for start in range(0, len(self.num_chars), self.chunk_size):
+            yield self.encode(self.num_chars[start:start + self.chunk_size])
+
+    @property
+    def ops(self) -> List[Op]:
+        # Only for small programs: all operations are held in memory
+        return [Init()] + [op for chunk in self.iter_chunks() for op in chunk]
+
+    def iter_ops(self) -> Iterator[Op]:
+        yield Init()
+        for chunk in self.iter_chunks():
+            for op in chunk:
+                if isinstance(op, Macro):
+                    yield from op.iter_ops()
+                else:
+                    yield op
+
+    @cached_property
+    def size(self) -> int:
+        return Init().size + sum(op.size for chunk in self.iter_chunks() for op in chunk)
+
+
+class ExpectedOutput:
+    """
+    Program output sink, checking output against an expected one as it is written, rather than
+    buffering it.
+
+    Attributes:
+        expected: expected output
+        position: number of characters written so far
+    """
+
+    def __init__(self, expected: str):
+        self.expected = expected
+        self.position = 0
+
+    def write(self, text: str):
+        if not self.expected.startswith(text, self.position):
+            raise RuntimeError(f'Program output differs from expected output after '
+                               f'{self.position} characters')
+        self.position += len(text)
+
+    @property
+    def complete(self) -> bool:
+        """
+        Whether the whole expected output was written.
+        """
+        return self.position == len(self.expected)
+
+
+# Instructions of U-turns and no-ops, by `path_macro_key`
+_path_macros_code: Dict[Hashable, array] = {}
+
+
+def _compile_chunk(chunk: List[Op]) -> Bytecode:
+    """
+    Compile a chunk of a mapped program. U-turns and no-ops, which fill most of the codels of
+    large paths, are compiled once.
+    """
+
+    code = array('q')
+    for op in chunk:
+        key = path_macro_key(op)
+        if key is None:
+            code.extend(Bytecode.compile_ops([op]).code)
+            continue
+        try:
+            op_code = _path_macros_code[key]
+        except KeyError:
+            op_code = _path_macros_code[key] = Bytecode.compile_ops([op]).code
+        code.extend(op_code)
+
+    return Bytecode(code)
+
+
+def fits_into_path(program: Program, iterations: int) -> bool:
+    """
+    Whether a program can be mapped to the path of a given number of iterations, without
+    holding either of them in memory.
+    """
+
+    try:
+        for _ in iter_map_program_to_path(program, iter_path(iterations)):
+            pass
+    except NotEnoughSpace:
+        return False
+    return True
+
+
+def render_program(program: Program, iterations: int, filepath: Path, initial_color: str,
+                   codel_size: int, run: bool = True, sink: TextIO = None,
+                   chunk_size: int = CHUNK_SIZE) -> Optional[Context]:
+    """
+    Map a program to the path of a given number of iterations, run it and render it as a PNG
+    image, streaming operations from the program to the image one chunk at a time.
+
+    Args:
+        program: program to map
+        iterations: number of iterations of the path
+        filepath: output PNG image file
+        initial_color: initial color of the image
+        codel_size: output codel size
+        run: run the mapped program, on the flat opcode virtual machine
+        sink: file-like object to stream program output to, as it runs (default: in-memory
+            buffer)
+        chunk_size: number of operations mapped, run and rendered at once
+
+    Returns:
+        The final context of the program, if run.
+
+    Raises:
+        NotEnoughSpace: the program doesn't fit into the path. Nothing is written then.
+
+    Notes:
+        Memory is bounded by the size of chunks, except for the grid of codels (one byte per
+        codel, i.e. about `45 * 9 ** (iterations - 1)` bytes), memory-mapped to a temporary file.
+    """
+
+    context = Context(sink=sink) if run else None
+
+    def run_chunks(chunks: Iterable[List[Op]]) -> Iterator[List[Op]]:
+        for chunk in chunks:
+            if context is not None:
+                _compile_chunk(chunk).run(context=context, track_codels=False)
+            yield chunk
+
+    ops = chain([Init()], iter_map_program_to_path(program, iter_path(iterations)))
+    chunks = iter(lambda: list(islice(ops, chunk_size)), [])
+
+    color = Color.from_name(initial_color)
+    width, height = path_dimensions(iterations)
+
+    with tempfile.TemporaryFile() as f:
+        grid = np.memmap(f, dtype=np.uint8, mode='w+', shape=(height, width))
+        grid[:] = WHITE_INDEX
+
+        # Last codel, in (x, y) order, with its cumulative color change
+        last_codel = None
+
+        for layout in Layout.iter_from_chunks(run_chunks(chunks)):
+            render_codels_into(grid, layout.xs, layout.ys, layout.lightness_changes,
+                               layout.hue_changes, color)
+
+            xs, ys = layout.xs, layout.ys
+            i = last_codel_index(xs, ys)
+            codel = (int(xs[i]), int(ys[i]),
+                     int(layout.lightness_changes[i]), int(layout.hue_changes[i]))
+            if last_codel is None or codel[:2] >= last_codel[:2]:
+                last_codel = codel
+
+        render_termination_codels(grid, *last_codel, color)
+
+        LOGGER.debug(f'Writing {width}x{height} codels to {filepath}')
+        write_png(filepath, grid, PALETTE, codel_size)
+
+        del grid
+
+    return context
@@ -0,0 +1,173 @@
+from array import array
+from typing import Dict, Iterable, TextIO, Tuple
+
+from hilbertpiet.context import DPS_X, DPS_Y, Context
+from hilbertpiet.macros import Macro
+from hilbertpiet.ops import Add, Divide, Duplicate, Extend, Init, Multiply, Op
+from hilbertpiet.ops import OutChar, OutNumber, Pointer, Pop, Push, Roll, Substract
+
+# Opcodes of primitive operations
+(INIT, EXTEND, PUSH, POP, DUPLICATE, ADD, SUBSTRACT, MULTIPLY, DIVIDE, POINTER,
+ OUT_NUMBER, OUT_CHAR, ROLL) = range(13)
+
+OPCODES = {Init: INIT, Extend: EXTEND, Push: PUSH, Pop: POP, Duplicate: DUPLICATE,
+           Add: ADD, Substract: SUBSTRACT, Multiply: MULTIPLY, Divide: DIVIDE,
+           Pointer: POINTER, OutNumber: OUT_NUMBER, OutChar: OUT_CHAR, Roll: ROLL}
+
+
+class Bytecode:
+    """
+    A Piet program compiled to a flat array of integer instructions, and the virtual machine
+    running it.
+
+    Each instruction is 4 consecutive integers: opcode, size of equivalent codel, lightness change
+    and hue change.
+
+    Attributes:
+        code: the instructions
+    """
+
+    def __init__(self, code: array):
+        self.code = code
+
+    @classmethod
+    def compile(cls, program: Macro) -> 'Bytecode':
+        """
+        Compile a program (or any macro) down to the instructions of its primitive operations.
+        """
+
+        return cls.compile_ops(program.iter_ops())
+
+    @classmethod
+    def compile_ops(cls, ops: Iterable[Op]) -> 'Bytecode':
+        """
+        Compile operations (e.g. a chunk of a program) down to the instructions of their
+        primitive operations.
+        """
+
+        code = array('q')
+        for op in ops:
+            if isinstance(op, Macro):
+                for primitive_op in op.iter_ops():
+                    code.extend(cls._compile_op(primitive_op))
+            else:
+                code.extend(cls._compile_op(op))
+        return cls(code)
+
+    @staticmethod
+    def _compile_op(op: Op) -> Tuple[int, int, int, int]:
+        try:
+            opcode = OPCODES[type(op)]
+        except KeyError:
+            raise ValueError(f'Invalid operation for compilation: "{op}"')
+
+        color_change = op.color_change
+        return opcode, op.size, int(color_change.real), int(color_change.imag)
+
+    def __len__(self) -> int:
+        return len(self.code) // 4
+
+    def run(self, sink: TextIO = None, context: Context = None,
+            track_codels: bool = True) -> Tuple[Context, Dict[Tuple[int, int], Tuple[int, int]]]:
+        """
+        Run instructions.
+
+        Args:
+            sink: file-like object to stream program output to, as it runs (default: in-memory
+                buffer)
+            context: context to resume running from, and to mutate (e.g. the final context of
+                the previous chunk of a program); its sink overrides `sink`
+                (default: new context)
+            track_codels: whether to track codels; codels are left empty otherwise (e.g. when
+                laid out separately, see :class:`hilbertpiet.layout.Layout`)
+
+        Returns:
+            Final context, and cumulative codels color change (in lightness and hue) from first
+            codel run, indexed by codel position.
+
+        Notes:
+            Equivalent to running the original program with its reference interpreter
+            (:meth:`hilbertpiet.run.Program.run`), without the checks performed by macros.
+        """
+
+        if context is None:
+            context = Context(sink=sink)
+
+        stack = context.stack
+        push, pop = stack.append, stack.pop
+        value = context.value
+        x, y, dp = context.x, context.y, context.dp_index
+        write = context.sink.write
+        codels = {}
+        lightness_change, hue_change = 0, 0
+
+        code = iter(self.code)
+        for opcode, size, op_lightness_change, op_hue_change in zip(code, code, code, code):
+
+            # Update codels
+
+            if track_codels:
+                lightness_change += op_lightness_change
+                hue_change += op_hue_change
+                codels[(x, y)] = (lightness_change, hue_change)
+
+            # Execute operation
+
+            if opcode == EXTEND:
+                # Block of codels
+                dx, dy = DPS_X[dp], DPS_Y[dp]
+                if track_codels:
+                    for step in range(1, size):
+                        codels[(x + step * dx, y + step * dy)] = (lightness_change, hue_change)
+
+                value += size
+                x += size * dx
+                y += size * dy
+                continue
+
+            if opcode == PUSH:
+                if value <= 0:
+                    raise RuntimeError(f'Invalid non-positive push value {value}')
+                push(value)
+            elif opcode == DUPLICATE:
+                push(stack[-1])
+            elif opcode == MULTIPLY:
+                b = pop()
+                stack[-1] *= b
+            elif opcode == ADD:
+                b = pop()
+                stack[-1] += b
+            elif opcode == SUBSTRACT:
+                b = pop()
+                stack[-1] -= b
+            elif opcode == DIVIDE:
+                b = pop()
+                stack[-1] //= b
+            elif opcode == OUT_CHAR:
+                write(chr(pop()))
+            elif opcode == POP:
+                pop()
+            elif opcode == POINTER:
+                dp = (dp + pop()) % 4
+            elif opcode == ROLL:
+                rolls, depth = pop(), pop()
+                if not 0 <= depth <= len(stack):
+                    raise RuntimeError(f'Invalid roll depth {depth} for stack of size {len(stack)}')
+                if depth and rolls % depth:
+                    rolls %= depth
+                    stack[-depth:] = stack[-rolls:] + stack[-depth:-rolls]
+            elif opcode == OUT_NUMBER:
+                write(f'{pop()} ')
+            elif opcode == INIT:
+                pass
+            else:
+                raise NotImplementedError
+
+            value = 1
+            x += size * DPS_X[dp]
+            y += size * DPS_Y[dp]
+
+        context.stack, context.value = stack, value
+        context.x, context.y, context.dp_index = x, y, dp
+
+        return context, codels
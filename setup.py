@@ -10,14 +10,14 @@ setup(name='hilbertpiet',
       license='closed',
       packages=find_packages(),
 
-      package_data={'hilbertpiet': ['data/piet_numbers.pkl']},
+      package_data={'hilbertpiet': ['data/numbers.bin', 'data/numbers.transitions.npy']},
 
       python_requires='>=3.7',
 
       classifiers=['Programming Language :: Python :: 3 :: Only',
                    'Operating System :: Unix'],
 
-      install_requires=['pillow'],
+      install_requires=['numpy', 'pillow'],
 
       extras_require={
           'testing': ['coverage', 'mock', 'pytest', 'pytest-cov']
@@ -26,6 +26,8 @@ setup(name='hilbertpiet',
       entry_points={
           'console_scripts': [
               'hilbertpiet = hilbertpiet.cli.main:main',
+              'hilbertpiet-batch = hilbertpiet.cli.batch:main',
+              'hilbertpiet-worker = hilbertpiet.cli.worker:main',
               'optimize-piet-numbers = hilbertpiet.cli.optimize_numbers:main'
           ]
       })
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import pytest
+
+from hilbertpiet.encoding import load_transition_costs, transition_costs_filepath
+from hilbertpiet.numbers import PushNumber
+from hilbertpiet.path import CACHE_DIR_ENV_VAR, load_path
+
+MODULE_ROOT: Path = Path(__file__).parent.parent / 'hilbertpiet'
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch) -> Path:
+    """
+    Cache paths into a temporary directory rather than the user cache directory, in tests and in
+    the processes they start.
+    """
+
+    cache_dir = tmp_path_factory.mktemp('cache') / 'hilbertpiet'
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(cache_dir))
+    load_path.cache_clear()
+    yield cache_dir
+    load_path.cache_clear()
+
+
+@pytest.fixture(scope='session')
+def numbers_filepath() -> Path:
+    """
+    Shipped table of numbers.
+    """
+    return MODULE_ROOT / 'data' / 'numbers.bin'
+
+
+@pytest.fixture
+def load_numbers(numbers_filepath):
+    """
+    Load the shipped numbers and costs of transitions between characters, for programs to be
+    encoded (see :data:`hilbertpiet.encoding.ENCODINGS`).
+    """
+    PushNumber.load_numbers(numbers_filepath)
+    load_transition_costs(transition_costs_filepath(numbers_filepath))
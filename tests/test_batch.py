@@ -0,0 +1,114 @@
+import json
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from hilbertpiet.cli.batch import Job, main, read_jobs, run_job, run_jobs
+
+pytestmark = pytest.mark.usefixtures('load_numbers')
+
+
+@pytest.fixture
+def inputs_dir(tmp_path) -> Path:
+    inputs_dir = tmp_path / 'inputs'
+    inputs_dir.mkdir()
+    (inputs_dir / 'hello.txt').write_text('Hello World!')
+    (inputs_dir / 'bye.txt').write_text('Bye World!\n')
+    (inputs_dir / 'notes.md').write_text('Not an input')
+    return inputs_dir
+
+
+def test_read_jobs_dir(tmp_path, inputs_dir):
+    jobs = read_jobs(inputs_dir, out_dir=tmp_path, suffix='.gif', encoding='delta')
+
+    assert jobs == [Job(inputs_dir / 'bye.txt', tmp_path / 'bye.gif', encoding='delta'),
+                    Job(inputs_dir / 'hello.txt', tmp_path / 'hello.gif', encoding='delta')]
+
+    assert read_jobs(inputs_dir)[0].out == inputs_dir / 'bye.png'
+
+
+def test_read_jobs_manifest(tmp_path, inputs_dir):
+    manifest_filepath = tmp_path / 'jobs.jsonl'
+    manifest_filepath.write_text(
+        json.dumps({'input': 'inputs/hello.txt', 'out': 'hello.png'}) + '\n\n' +
+        json.dumps({'input': 'inputs/bye.txt', 'out': '/tmp/bye.png', 'codel_size': 1}) + '\n' +
+        json.dumps({'text': 'Hi!', 'out': 'hi.png'}))
+
+    jobs = read_jobs(manifest_filepath, encoding='stack', codel_size=2)
+
+    assert jobs == [Job(inputs_dir / 'hello.txt', tmp_path / 'hello.png', encoding='stack',
+                        codel_size=2),
+                    Job(inputs_dir / 'bye.txt', Path('/tmp/bye.png'), encoding='stack',
+                        codel_size=1),
+                    Job(None, tmp_path / 'hi.png', text='Hi!', encoding='stack', codel_size=2)]
+
+
+@pytest.mark.parametrize('job', [{'input': 'hello.txt'},
+                                 {'input': 'hello.txt', 'out': 'hello.png', 'size': 1},
+                                 {'input': 'hello.txt', 'out': 'hello.png', 'encoding': 'zip'},
+                                 'not json'])
+def test_read_jobs_manifest_invalid(tmp_path, job):
+    manifest_filepath = tmp_path / 'jobs.jsonl'
+    manifest_filepath.write_text(job if isinstance(job, str) else json.dumps(job))
+
+    with pytest.raises(ValueError, match='Invalid .* on line 1'):
+        read_jobs(manifest_filepath)
+
+
+def test_run_job(tmp_path, inputs_dir):
+    job = Job(inputs_dir / 'hello.txt', tmp_path / 'hello.png', codel_size=2)
+
+    record = run_job(job)
+
+    assert record['status'] == 'ok'
+    assert record['characters'] == len('Hello World!')
+    assert record['iterations'] == 2
+    assert list(record['timings']) == ['read', 'encode', 'map', 'run', 'save', 'total']
+    assert Image.open(job.out).size == (90, 36)
+
+
+def test_run_job_text(tmp_path):
+    record = run_job(Job(None, tmp_path / 'hello.png', text='Hello World!'))
+
+    assert record['status'] == 'ok'
+    assert 'input' not in record
+    assert (tmp_path / 'hello.png').exists()
+
+
+def test_run_job_error(tmp_path):
+    record = run_job(Job(tmp_path / 'missing.txt', tmp_path / 'missing.png'))
+
+    assert record['status'] == 'error'
+    assert record['error'].startswith('FileNotFoundError')
+    assert not (tmp_path / 'missing.png').exists()
+
+
+def test_run_jobs(tmp_path, inputs_dir, numbers_filepath):
+    jobs = read_jobs(inputs_dir, out_dir=tmp_path, run=False)
+    jobs.insert(1, Job(tmp_path / 'missing.txt', tmp_path / 'missing.png'))
+
+    records = list(run_jobs(jobs, numbers_filepath, processes=2))
+
+    assert [record['input'] for record in records] == [str(job.input) for job in jobs]
+    assert [record['status'] for record in records] == ['ok', 'error', 'ok']
+    assert 'run' not in records[0]['timings']
+    assert (tmp_path / 'bye.png').exists() and (tmp_path / 'hello.png').exists()
+
+
+def test_main_text_job_error(tmp_path, monkeypatch):
+    manifest_filepath = tmp_path / 'jobs.jsonl'
+    manifest_filepath.write_text(
+        json.dumps({'text': 'Hi!', 'out': 'hi.png', 'codel_size': 0}) + '\n' +
+        json.dumps({'text': 'Bye!', 'out': 'bye.png'}))
+    results_filepath = tmp_path / 'results.jsonl'
+
+    monkeypatch.setattr('sys.argv', ['hilbertpiet-batch', str(manifest_filepath), '--jobs', '1',
+                                     '--results', str(results_filepath)])
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == 1
+
+    records = [json.loads(line) for line in results_filepath.read_text().splitlines()]
+    assert [record['status'] for record in records] == ['error', 'ok']
+    assert (tmp_path / 'bye.png').exists()
@@ -0,0 +1,64 @@
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+ROOT: Path = Path(__file__).parent.parent
+
+
+@pytest.fixture(scope='module')
+def benchmark():
+    # Benchmarks are a script, out of the package
+    filepath = ROOT / 'benchmarks' / 'benchmark.py'
+    spec = importlib.util.spec_from_file_location('benchmark', filepath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_inputs(benchmark):
+    sizes = [len(text()) for text in benchmark.INPUTS.values()]
+    assert sizes == sorted(sizes)
+    assert sizes[-1] == 2 ** 20
+
+    cowsay = benchmark.INPUTS['cowsay']()
+    assert cowsay.startswith(' ___')
+    assert cowsay.endswith('||     ||\n')
+
+
+def test_run_benchmarks(benchmark):
+    results = benchmark.run_benchmarks(['hello', 'lorem'], benchmark.STAGES, max_iterations=2,
+                                       repeat=2)
+
+    benchmarks = results['benchmarks']
+    assert set(benchmarks) == {f'{stage}[{input}]'
+                               for stage in benchmark.STAGES if stage != 'optimize_numbers'
+                               for input in ['hello', 'lorem']} | {'optimize_numbers[numbers-127]'}
+
+    assert len(benchmarks['run[hello]']['times']) == 2
+    assert benchmarks['run[hello]']['iterations'] == 2
+    assert benchmarks['run[hello]']['characters'] == len('Hello World!')
+
+    # Lorem ipsum takes more than 2 iterations: it is only streamed
+    assert 'skipped' in benchmarks['run[lorem]']
+    assert benchmarks['render_program[lorem]']['iterations'] == 4
+
+    # Results are JSON
+    assert json.loads(json.dumps(results)) == results
+
+
+def test_compare(benchmark):
+    baseline = {'benchmarks': {'run[hello]': {'best': 1.0}, 'run[lorem]': {'best': 1.0},
+                               'render[hello]': {'skipped': 'too large'}}}
+    results = {'benchmarks': {'run[hello]': {'best': 1.2}, 'run[lorem]': {'best': 1.3},
+                              'render[hello]': {'best': 1.0}, 'save_gif[hello]': {'best': 1.0}}}
+
+    comparisons = benchmark.compare(results, baseline, threshold=0.25)
+
+    assert [(comparison['name'], comparison['regression']) for comparison in comparisons] == \
+        [('run[hello]', False), ('run[lorem]', True)]
+
+    # Slowdowns too small to be measured reliably
+    comparisons = benchmark.compare(results, baseline, threshold=0.25, min_difference=0.5)
+    assert not any(comparison['regression'] for comparison in comparisons)
@@ -45,3 +45,18 @@ def test_color_codes(color_name, expected_color_code):
     color = Color.from_name(color_name)
     color_code = color.code
     assert color_code == expected_color_code
+
+
+@pytest.mark.parametrize('color_name, expected_color_code', color_name_to_codes)
+def test_color_rgb(color_name, expected_color_code):
+    color = Color.from_name(color_name)
+    r, g, b = color.rgb
+    assert f'#{r:02X}{g:02X}{b:02X}' == expected_color_code
+
+
+def test_palette():
+    palette = Color.palette()
+    assert len(palette) == 18
+    for lightness, hue in lightness_hue_params:
+        color = Color(lightness, hue)
+        assert palette[color.index] == color.rgb
@@ -1,3 +1,5 @@
+import io
+
 import pytest
 
 from hilbertpiet.context import Context
@@ -43,3 +45,79 @@ def test_rotate(dp, steps):
     context.rotate_dp(steps=steps)
 
     assert context.dp == expected_dp
+
+
+def test_slots():
+    assert not hasattr(Context(), '__dict__')
+
+
+def test_exact_large_position():
+    # Beyond float precision
+    x = 2 ** 60 + 1
+
+    context = Context()
+    context.update_position(steps=x)
+    context.rotate_dp(steps=1)
+    context.update_position(steps=x)
+
+    assert (context.x, context.y) == (x, x)
+
+
+@pytest.mark.parametrize('context,expected', [
+    pytest.param(Context(), True, id='empty'),
+    pytest.param(Context(stack=[1, 2, 3]), False, id='stack'),
+    pytest.param(Context(value=4), False, id='value'),
+    pytest.param(Context(position=3 + 2j), False, id='position'),
+    pytest.param(Context(dp=-1j), False, id='dp'),
+    pytest.param(Context(output='toto'), False, id='output')
+])
+def test_is_empty(context, expected):
+    assert context.is_empty == expected
+
+
+def test_is_empty_buffered_sink():
+    class Sink:
+        def __init__(self, value: str):
+            self.value = value
+
+        def write(self, text: str):
+            self.value += text
+
+        def getvalue(self) -> str:
+            return self.value
+
+    assert Context(sink=Sink('')).is_empty
+    assert not Context(sink=Sink('toto')).is_empty
+
+
+def test_output_sink():
+    sink = io.StringIO()
+    context = Context(output='to', sink=sink)
+    context.sink.write('to')
+
+    assert sink.getvalue() == 'toto'
+    assert context.output == 'toto'
+
+
+def test_unbuffered_output():
+    class Sink:
+        def write(self, text: str):
+            pass
+
+    context = Context(sink=Sink())
+    with pytest.raises(RuntimeError, match='Unbuffered output'):
+        print(context.output)
+
+
+def test_eq_unbuffered_output():
+    class Sink:
+        def write(self, text: str):
+            pass
+
+    sink = Sink()
+
+    assert Context(stack=[1], sink=sink) == Context(stack=[1], sink=sink)
+    assert Context(stack=[1], sink=sink) != Context(stack=[2], sink=sink)
+    assert Context(sink=sink) != Context(sink=Sink())
+    assert Context(sink=sink) != Context()
+    assert Context(output='a') == Context(output='a')
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from hilbertpiet.context import Context
+from hilbertpiet.encoding import ENCODINGS, encode_delta, encode_stack, save_transition_costs
+from hilbertpiet.encoding import transition_cost, transition_costs_filepath, transition_ops
+from hilbertpiet.numbers import PushNumber
+from hilbertpiet.ops import Add, Duplicate, OutChar, Roll
+from hilbertpiet.run import Program
+
+COWSAY = r"""
+ _______
+< Hello >
+ -------
+        \   ^__^
+         \  (oo)\_______
+            (__)\       )\/\
+                ||----w |
+                ||     ||
+"""
+
+pytestmark = pytest.mark.usefixtures('load_numbers')
+
+
+@pytest.mark.parametrize('encoding', list(ENCODINGS))
+@pytest.mark.parametrize('text', ['', 'a', 'Hello World!', 'aaaa bbb aaa', 'abcabcabc', COWSAY])
+def test_encoding(encoding, text):
+    program = Program(ENCODINGS[encoding]([ord(c) for c in text]))
+
+    expected_context = program.run()
+    context = program.run(compiled=True)
+
+    assert context.output == text
+    assert context == expected_context
+    # Nothing left behind
+    assert context.stack == []
+
+
+def test_encode_stack_run():
+    ops = encode_stack([ord(c) for c in 'aaa'])
+    assert ops == [PushNumber(ord('a')), Duplicate(), Duplicate(), OutChar(), OutChar(), OutChar()]
+
+
+def test_encode_stack_roll():
+    ops = encode_stack([ord(c) for c in 'abab'])
+    assert Roll() in ops
+
+
+@pytest.mark.parametrize('encoding', ['stack', 'delta'])
+@pytest.mark.parametrize('text', ['Hello World!', COWSAY])
+def test_encoding_smaller(encoding, text):
+    num_chars = [ord(c) for c in text]
+    plain_program = Program(ENCODINGS['plain'](num_chars))
+    program = Program(ENCODINGS[encoding](num_chars))
+
+    assert program.size < plain_program.size
+
+
+@pytest.mark.parametrize('previous,next', [(72, 72), (72, 101), (101, 72), (1, 126), (126, 1)])
+def test_transition_ops(previous, next):
+    context = Context(stack=[previous], value=1)
+    for op in transition_ops(previous, next):
+        context = op(context)
+
+    assert context.stack == [next]
+
+
+def test_transition_costs(tmp_path, numbers_filepath):
+    shipped_costs = np.load(transition_costs_filepath(numbers_filepath))
+
+    save_transition_costs(tmp_path / 'transitions.npy', max_num=len(shipped_costs) - 1)
+    costs = np.load(tmp_path / 'transitions.npy')
+
+    np.testing.assert_array_equal(costs, shipped_costs)
+
+    for previous in range(1, len(costs)):
+        for next in range(1, len(costs)):
+            expected_cost = sum(op.size for op in transition_ops(previous, next))
+            assert transition_cost(previous, next) == expected_cost
+
+
+def test_transition_cost_outside_table():
+    assert transition_cost(1000, 1001) == 2
+    assert transition_cost(1001, 1000) == 2
+    assert transition_cost(65, 1000) == sum(op.size for op in transition_ops(65, 1000))
+
+
+def test_encode_delta():
+    ops = encode_delta([ord(c) for c in 'aab'])
+    assert ops == [PushNumber(ord('a')), Duplicate(), OutChar(),
+                   Duplicate(), OutChar(),
+                   PushNumber(1), Add(), OutChar()]
@@ -0,0 +1,121 @@
+from pathlib import Path
+
+import mock
+import numpy as np
+import pytest
+from PIL import Image
+
+from hilbertpiet.layout import Layout
+from hilbertpiet.macros import Resize
+from hilbertpiet.numbers import PushNumber
+from hilbertpiet.ops import Add, Duplicate, OutChar, Pointer, Push
+from hilbertpiet.path import UTurnAntiClockwise, UTurnClockwise
+from hilbertpiet.path import generate_path, map_path_u_turns, map_program_to_path
+from hilbertpiet.run import Program
+
+
+@pytest.fixture(scope='module')
+def mapped_program():
+    MODULE_ROOT: Path = Path(__file__).parent.parent / 'hilbertpiet'
+    PushNumber.load_numbers(MODULE_ROOT / 'data' / 'numbers.bin')
+
+    ops = []
+    for c in 'Hello World!':
+        ops += [PushNumber(ord(c)), OutChar()]
+    program = map_program_to_path(Program(ops), map_path_u_turns(generate_path(2)))
+
+    return program
+
+
+def test_from_arrays():
+    # Second operation is a block of 3 codels
+    layout = Layout.from_arrays(sizes=np.array([1, 3, 1, 1, 1]),
+                                lightness_changes=np.array([0, 1, 2, 0, 1]),
+                                hue_changes=np.array([0, 4, 1, 3, 5]),
+                                dp_steps=np.array([0, 0, 1, 3, 2]))
+
+    assert layout.xs.tolist() == [0, 1, 2, 3, 4, 4, 5]
+    assert layout.ys.tolist() == [0, 0, 0, 0, 0, 1, 1]
+    assert layout.lightness_changes.tolist() == [0, 1, 1, 1, 3, 3, 4]
+    assert layout.hue_changes.tolist() == [0, 4, 4, 4, 5, 8, 13]
+
+
+@pytest.mark.parametrize('ops', [
+    pytest.param([Resize(3), Push(), Duplicate(), Add()], id='no_uturn'),
+    pytest.param([UTurnClockwise(), Push(), UTurnAntiClockwise(), UTurnAntiClockwise()],
+                 id='uturns')
+])
+def test_from_program(ops):
+    program = Program(ops)
+    program.run()
+
+    layout = Layout.from_program(program)
+
+    assert list(layout.codels.items()) == list(program.codels.items())
+
+
+def test_from_mapped_program(mapped_program):
+    mapped_program.run()
+
+    layout = Layout.from_program(mapped_program)
+
+    assert list(layout.codels.items()) == list(mapped_program.codels.items())
+
+
+def test_from_program_stack_dependent_pointer():
+    program = Program([Resize(3), Push(), Pointer()])
+    with pytest.raises(ValueError, match='Invalid stack-dependent operation for layout'):
+        print(Layout.from_program(program))
+
+
+def test_render(mapped_program):
+    mapped_program.run()
+
+    layout = Layout.from_program(mapped_program)
+
+    img = layout.render(initial_color='darkgreen', codel_size=3)
+    expected_img = mapped_program.render(initial_color='darkgreen', codel_size=3)
+    assert np.array_equal(np.array(img), np.array(expected_img))
+
+    frames = layout.render_frames(codel_size=3)
+    expected_frames = mapped_program.render_frames(codel_size=3)
+    for frame, expected_frame in zip(frames, expected_frames):
+        assert np.array_equal(np.array(frame.convert('RGB')),
+                              np.array(expected_frame.convert('RGB')))
+
+
+@pytest.mark.parametrize('suffix', ['.png', '.bmp'])
+def test_save(tmp_path, mapped_program, suffix):
+    layout = Layout.from_program(mapped_program)
+    filepath = tmp_path / f'program{suffix}'
+
+    layout.save(filepath, initial_color='darkgreen', codel_size=3)
+
+    expected_img = layout.render(initial_color='darkgreen', codel_size=3)
+    img = Image.open(filepath)
+    assert np.array_equal(np.array(img.convert('RGB')), np.array(expected_img))
+
+
+@pytest.mark.parametrize('suffix, options', [('.gif', {}), ('.webp', {'lossless': True})])
+def test_save_animated(tmp_path, mapped_program, suffix, options):
+    layout = Layout.from_program(mapped_program)
+
+    with mock.patch.object(Image.Image, 'save', autospec=True) as mock_save:
+        layout.save(tmp_path / f'program{suffix}', initial_color='red', codel_size=3)
+
+    _, kwargs = mock_save.call_args
+    assert len(kwargs['append_images']) == 5
+    assert {key: kwargs[key] for key in ['lossless'] if key in kwargs} == options
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_iter_from_chunks(mapped_program, chunk_size):
+    expected_layout = Layout.from_program(mapped_program)
+
+    ops = mapped_program.ops
+    chunks = [ops[i:i + chunk_size] for i in range(0, len(ops), chunk_size)]
+    layouts = list(Layout.iter_from_chunks(chunks))
+
+    for attribute in ('xs', 'ys', 'lightness_changes', 'hue_changes'):
+        values = np.concatenate([getattr(layout, attribute) for layout in layouts])
+        assert values.tolist() == getattr(expected_layout, attribute).tolist()
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import Iterator, List
 
 import mock
 import pytest
@@ -67,6 +67,12 @@ def test_expanded_ops():
     assert CABCB().expanded_ops == [C(), A(), B(), C(), B()]
 
 
+def test_iter_ops():
+    ops = CABCB().iter_ops()
+    assert isinstance(ops, Iterator)
+    assert list(ops) == [C(), A(), B(), C(), B()]
+
+
 def test_size():
     assert CABCB().size == 5
 
@@ -77,7 +83,18 @@ def test_resize(value):
 
     with mock.patch.object(Extend, '__call__') as mock_call_Extend:
         op(Context(value=1))
-        assert mock_call_Extend.call_count == value - 1
+        # Single block of codels
+        assert mock_call_Extend.call_count == 1
+
+    context = op(Context(value=1))
+    assert context.value == value
+
+
+@pytest.mark.parametrize('value', [2, 3, 4, 10])
+def test_resize_size(value):
+    op = Resize(value)
+    assert op.size == value - 1
+    assert op.expanded_ops == [Extend(value - 1)]
 
 
 @pytest.mark.parametrize('size', [-4, 0, 1])
@@ -0,0 +1,134 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from hilbertpiet.cli.main import ENCODING_NAMES, main_large
+from hilbertpiet.encoding import ENCODINGS
+from hilbertpiet.macros import Resize
+from hilbertpiet.ops import Push
+from hilbertpiet.path import NotEnoughSpace
+from hilbertpiet.stats import Stats
+from hilbertpiet.stream import ChunkedProgram
+
+ROOT: Path = Path(__file__).parent.parent
+
+# Modules slow to import, only needed by some stages of the script
+HEAVY_MODULES = ['numpy', 'PIL.Image', 'concurrent.futures.process', 'hilbertpiet.numbers',
+                 'hilbertpiet.stream']
+
+# Cold-start budget of the script, on top of the startup of the interpreter, in seconds
+HELP_BUDGET = 0.3
+SMALL_GENERATION_BUDGET = 1.5
+
+
+def _run_main(args: List[str]) -> List[str]:
+    """
+    Run the script in a new interpreter.
+
+    Returns:
+        The heavy modules it imported.
+    """
+
+    script = (f'import json, sys\n'
+              f'sys.argv = ["hilbertpiet"] + {args!r}\n'
+              f'from hilbertpiet.cli.main import main\n'
+              f'try:\n'
+              f'    main()\n'
+              f'except SystemExit:\n'
+              f'    pass\n'
+              f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n')
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                            capture_output=True, text=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def _cold_start_time(args: List[str]) -> float:
+    """
+    Best wall time of the script run in a new interpreter, less the startup of the interpreter.
+    """
+
+    def best_time(command: List[str]) -> float:
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=ROOT, check=True, capture_output=True)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    return (best_time([sys.executable, '-m', 'hilbertpiet.cli.main'] + args)
+            - best_time([sys.executable, '-c', 'pass']))
+
+
+def test_encoding_names():
+    assert ENCODING_NAMES == list(ENCODINGS)
+
+
+@pytest.mark.parametrize('args', [['--help'], ['--encoding', 'zip', '-o', 'out.png'], []])
+def test_deferred_imports(args):
+    assert _run_main(args) == []
+
+
+def test_deferred_imports_small_generation(tmp_path):
+    filepath = tmp_path / 'hello.png'
+    assert _run_main(['-i', 'Hello World!', '-o', str(filepath)]) == ['numpy',
+                                                                      'hilbertpiet.numbers']
+    assert filepath.exists()
+
+    assert 'PIL.Image' in _run_main(['-i', 'Hello World!', '-o', str(tmp_path / 'hello.gif')])
+
+
+@pytest.mark.benchmark
+def test_cold_start(tmp_path):
+    assert _cold_start_time(['--help']) < HELP_BUDGET
+    assert _cold_start_time(['-i', 'Hello World!', '-o', str(tmp_path / 'hello.png')]) < \
+        SMALL_GENERATION_BUDGET
+
+
+@pytest.mark.parametrize('args, stages', [
+    ([], ['read', 'load', 'encode', 'path', 'map', 'layout', 'run', 'save']),
+    (['--large'], ['read', 'load', 'encode', 'render_program'])
+])
+def test_stats(tmp_path, args, stages):
+    filepath = tmp_path / 'hello.png'
+    stats_filepath = tmp_path / 'stats.json'
+    _run_main(['-i', 'Hello World!', '-o', str(filepath), '--stats', str(stats_filepath)] + args)
+
+    stats = json.loads(stats_filepath.read_text())
+    assert stats['status'] == 'ok'
+    assert list(stats['stages']) == stages
+    assert set(stats['stages']['run' if 'run' in stages else 'render_program']) == \
+        {'wall_time', 'cpu_time', 'peak_memory', 'peak_rss'}
+
+    assert stats['characters'] == len('Hello World!')
+    assert stats['iterations'] == 2
+    assert stats['codels_after_mapping'] == 404
+    assert (stats['codels_width'], stats['codels_height']) == (45, 18)
+    assert (stats['image_width'], stats['image_height']) == (900, 360)
+    assert stats['file_size'] == filepath.stat().st_size
+
+
+def test_stats_stderr():
+    result = subprocess.run([sys.executable, '-m', 'hilbertpiet.cli.main', '-i', 'Hello World!',
+                             '--plan', '--stats'], cwd=ROOT, check=True, capture_output=True,
+                            text=True)
+
+    stats = json.loads(result.stderr.splitlines()[-1])
+    assert stats['status'] == 'ok'
+    assert stats['iterations'] == 2
+    assert 'map' not in stats['stages']
+
+
+def test_main_large_op_too_large(tmp_path):
+    # `Extend` operation of the resize, and push, fit into no slot of a path
+    program = ChunkedProgram([ord('a')], lambda num_chars: [Resize(30), Push()])
+    args = argparse.Namespace(out=tmp_path / 'large.png', initial_color='red', codel_size=1,
+                              no_run=True)
+
+    with pytest.raises(NotEnoughSpace, match='in any path'):
+        main_large(program, 1, args, Stats())
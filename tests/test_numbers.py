@@ -1,9 +1,11 @@
+import math
+import pickle
 from pathlib import Path
 
 import pytest
 
 from hilbertpiet.context import Context
-from hilbertpiet.numbers import PushNumber, UnaryNumberTree
+from hilbertpiet.numbers import NumberTable, PushNumber, UnaryNumberTree
 
 
 @pytest.mark.parametrize('tree,n', [
@@ -47,11 +49,12 @@ def test_number_tree_str(tree, expected):
 ])
 def test_number_tree_cost(tree, expected):
     assert tree._cost == expected
+    assert sum(op.size for op in tree.iter_ops()) == expected
 
 
 def test_push_number():
     MODULE_ROOT: Path = Path(__file__).parent.parent / 'hilbertpiet'
-    numbers_filepath = MODULE_ROOT / 'data' / 'numbers.pkl'
+    numbers_filepath = MODULE_ROOT / 'data' / 'numbers.bin'
 
     PushNumber.load_numbers(numbers_filepath)
     for n in range(1, 1000):
@@ -59,3 +62,76 @@ def test_push_number():
         assert number(Context(value=1)).stack == [n]
         assert number._cost == number._tree._cost
         assert eval(PushNumber(n).decomposition) == n
+
+
+@pytest.mark.parametrize('n', [1000, 1001, 65535, 0x10FFFF, 10 ** 12, 2 ** 64 + 17])
+def test_push_number_outside_table(n):
+    MODULE_ROOT: Path = Path(__file__).parent.parent / 'hilbertpiet'
+    numbers_filepath = MODULE_ROOT / 'data' / 'numbers.bin'
+
+    PushNumber.load_numbers(numbers_filepath)
+    number = PushNumber(n)
+    assert number(Context(value=1)).stack == [n]
+    assert number._cost == sum(op.size for op in number.iter_ops())
+    assert eval(number.decomposition) == n
+
+    # Logarithmic cost
+    assert number._cost <= 10 * math.log(n)
+
+    # Decomposition is cached, until numbers are reloaded
+    assert PushNumber(n)._tree is number._tree
+    PushNumber.load_numbers(numbers_filepath)
+    assert n <= 1000 or PushNumber(n)._tree is not number._tree
+
+
+def test_number_table(tmp_path):
+    one, two = UnaryNumberTree(1), UnaryNumberTree(2)
+    four = two * two
+    trees = {1: one, 2: two, 3: two + one, 4: four, 5: four + one,
+             6: UnaryNumberTree(3) * two, 256: four ** four, 200: UnaryNumberTree(200)}
+    trees.update({n: UnaryNumberTree(n) for n in range(7, 256) if n not in trees})
+
+    filepath = tmp_path / 'numbers.bin'
+    NumberTable.from_trees(trees).save(filepath)
+    table = NumberTable.load(filepath)
+
+    assert table.max_n == 256
+    assert 256 in table and 0 not in table and 257 not in table
+    with pytest.raises(KeyError):
+        table[257]
+
+    # Numbers are decoded on first use, sharing the trees of the other numbers they refer to
+    assert not table._trees
+    assert table[5] == four + one
+    assert table[5].n1 is table[4]
+    assert sorted(table._trees) == [1, 2, 4, 5]
+
+    for n, tree in trees.items():
+        assert table[n] == tree
+        assert table.costs[n] == tree.size
+
+
+def test_number_table_invalid(tmp_path):
+    with pytest.raises(ValueError, match='Invalid set of numbers'):
+        NumberTable.from_trees({1: UnaryNumberTree(1), 3: UnaryNumberTree(3)})
+
+    filepath = tmp_path / 'numbers.bin'
+    filepath.write_bytes(b'not a table')
+    with pytest.raises(ValueError, match='Invalid numbers file'):
+        NumberTable.load(filepath)
+
+
+def test_load_numbers_pickle(tmp_path):
+    MODULE_ROOT: Path = Path(__file__).parent.parent / 'hilbertpiet'
+    numbers_filepath = MODULE_ROOT / 'data' / 'numbers.bin'
+
+    table = NumberTable.load(numbers_filepath)
+    trees = {n: table[n] for n in range(1, table.max_n + 1)}
+    pickle_filepath = tmp_path / 'numbers.pkl'
+    with pickle_filepath.open('wb') as f:
+        pickle.dump(trees, f)
+
+    PushNumber.load_numbers(pickle_filepath)
+    numbers = [PushNumber(n) for n in range(1, 2000)]
+    PushNumber.load_numbers(numbers_filepath)
+    assert numbers == [PushNumber(n) for n in range(1, 2000)]
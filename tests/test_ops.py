@@ -5,7 +5,8 @@ import pytest
 
 from hilbertpiet.context import Context
 from hilbertpiet.ops import Add, Divide, Duplicate, Init, Multiply, Op
-from hilbertpiet.ops import Extend, OutChar, OutNumber, Pointer, Pop, Push, Substract
+from hilbertpiet.ops import Extend, OutChar, OutNumber, Pointer, Pop, Push, Roll, Substract
+from hilbertpiet.path import UTurnClockwise
 
 
 def test_str():
@@ -23,6 +24,38 @@ def test_str():
     assert str(op) == "DummyOp 2 'e' 1"
 
 
+@pytest.mark.parametrize('op_class', [
+    Init, Extend, Push, Pop, Duplicate, Roll, Add, Substract, Multiply, Divide, Pointer, OutNumber,
+    OutChar
+])
+def test_slots(op_class):
+    assert not hasattr(op_class(), '__dict__')
+
+
+@pytest.mark.parametrize('op_class', [
+    Init, Push, Pop, Duplicate, Roll, Add, Substract, Multiply, Divide, Pointer, OutNumber, OutChar
+])
+def test_flyweight(op_class):
+    assert op_class() is op_class()
+
+
+def test_stateful_not_flyweight():
+    assert Extend(3) is not Extend(3)
+    assert Extend(3) == Extend(3)
+
+
+def test_macro_not_flyweight():
+    assert UTurnClockwise() is not UTurnClockwise()
+
+
+def test_subclass_not_flyweight():
+    class LoudPush(Push):
+        pass
+
+    assert LoudPush() is not LoudPush()
+    assert Push() is Push()
+
+
 @pytest.mark.parametrize('op,expected_size', [
     (Init(), 1), (Extend(), 1), (Push(), 1), (Pop(), 1), (Duplicate(), 1),
     (Add(), 1), (Substract(), 1), (Multiply(), 1), (Divide(), 1), (Pointer(), 1)
@@ -110,6 +143,26 @@ def test_extend(value):
             assert context.output == 'toto'
 
 
+@pytest.mark.parametrize('count', [2, 3, 10])
+def test_extend_block(count):
+    op = Extend(count)
+
+    with mock.patch.object(Context, 'update_position') as mock_update_position:
+        context = Context(stack=[2, 20, 3], value=1)
+
+        context = op(context)
+
+        assert op.size == count
+        assert context.value == 1 + count
+        mock_update_position.assert_called_with(steps=count)
+
+
+@pytest.mark.parametrize('count', [-1, 0])
+def test_extend_invalid_count(count):
+    with pytest.raises(ValueError, match='Invalid non-positive extend count'):
+        print(Extend(count))
+
+
 @pytest.mark.parametrize('value', [4, 5, 6])
 def test_push(value):
     op = Push()
@@ -182,3 +235,23 @@ def test_out_number(op):
                 assert context.output == 'output is nop'
             else:
                 raise NotImplementedError
+
+
+@pytest.mark.parametrize('stack,expected_stack', [
+    ([1, 2, 3, 4, 3, 1], [1, 4, 2, 3]),
+    ([1, 2, 3, 4, 3, 2], [1, 3, 4, 2]),
+    ([1, 2, 3, 4, 3, 3], [1, 2, 3, 4]),
+    ([1, 2, 3, 4, 3, -1], [1, 3, 4, 2]),
+    ([1, 2, 3, 4, 4, 1], [4, 1, 2, 3]),
+    ([1, 2, 3, 4, 0, 5], [1, 2, 3, 4]),
+    ([1, 2, 3, 4, 2, 0], [1, 2, 3, 4])
+])
+def test_roll(stack, expected_stack):
+    context = Roll()(Context(stack=stack))
+    assert context.stack == expected_stack
+
+
+@pytest.mark.parametrize('depth', [-1, 5])
+def test_roll_invalid_depth(depth):
+    with pytest.raises(RuntimeError, match='Invalid roll depth'):
+        print(Roll()(Context(stack=[1, 2, 3, 4, depth, 1])))
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from hilbertpiet.cli.optimize_numbers import PushNumberOptimizer
+from hilbertpiet.context import Context
+from hilbertpiet.numbers import NumberTable, PushNumber
+
+
+def test_optimize(tmp_path):
+    MODULE_ROOT: Path = Path(__file__).parent.parent / 'hilbertpiet'
+    PushNumber.load_numbers(MODULE_ROOT / 'data' / 'numbers.bin')
+    expected_cost = sum(PushNumber(n)._cost for n in range(1, 128))
+
+    opt = PushNumberOptimizer(max_num=127)
+    relaxations = opt.optimize()
+
+    assert relaxations > 0
+    for n, num in opt.nums.items():
+        assert num._tree(Context(value=1)).stack == [n]
+        assert num._cost == sum(op.size for op in num.iter_ops())
+
+    # At least as good as the shipped numbers
+    assert sum(num._cost for num in opt.nums.values()) <= expected_cost
+
+    # Fixed point
+    assert opt.optimize() == 0
+
+    # Saved as a number table
+    filepath = tmp_path / 'numbers.bin'
+    opt.save(filepath)
+    table = NumberTable.load(filepath)
+    for n, num in opt.nums.items():
+        assert table[n] == num._tree
+        assert table.costs[n] == num._cost
@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from hilbertpiet.encoding import ENCODINGS
+from hilbertpiet.pages import generate_pages, manifest_filepath, page_filepath, split_pages
+from hilbertpiet.path import load_path, map_program_to_path, path_dimensions
+from hilbertpiet.run import Program
+
+TEXT = 'Hello World!\nHello again, World!\n' * 12
+
+pytestmark = pytest.mark.usefixtures('load_numbers')
+
+
+@pytest.mark.parametrize('encoding', list(ENCODINGS))
+@pytest.mark.parametrize('iterations', [1, 2])
+def test_split_pages(encoding, iterations):
+    num_chars = [ord(c) for c in TEXT]
+    encode = ENCODINGS[encoding]
+
+    bounds = split_pages(num_chars, encode, iterations)
+
+    assert len(bounds) > 1
+    assert bounds[0][0] == 0
+    assert bounds[-1][1] == len(num_chars)
+    for (_, end), (start, _) in zip(bounds, bounds[1:]):
+        assert end == start
+
+    # Each page fits
+    path = load_path(iterations)
+    for start, end in bounds:
+        map_program_to_path(Program(encode(num_chars[start:end])), path)
+
+
+def test_split_pages_empty():
+    assert split_pages([], ENCODINGS['plain'], 2) == []
+
+
+def test_split_pages_invalid():
+    with pytest.raises(ValueError, match='Invalid number of iterations'):
+        split_pages([ord(c) for c in TEXT], ENCODINGS['plain'], 0)
+
+
+def test_page_filepath():
+    assert page_filepath(Path('out/hello.png'), 0) == Path('out/hello-0001.png')
+    assert page_filepath(Path('out/hello.png'), 41) == Path('out/hello-0042.png')
+    assert manifest_filepath(Path('out/hello.png')) == Path('out/hello.json')
+
+
+def test_generate_pages(tmp_path, numbers_filepath):
+    num_chars = [ord(c) for c in TEXT]
+    filepath = tmp_path / 'hello.png'
+
+    pages = generate_pages(num_chars, filepath, 2, 'delta', initial_color='blue', codel_size=2,
+                           numbers_filepath=numbers_filepath, jobs=2)
+
+    assert [(page.start, page.end) for page in pages] == split_pages(num_chars,
+                                                                     ENCODINGS['delta'], 2)
+    width, height = path_dimensions(2)
+    for index, page in enumerate(pages):
+        assert page.index == index
+        assert page.image == page_filepath(filepath, index)
+        assert page.iterations <= 2
+        if index < len(pages) - 1:
+            assert page.iterations == 2
+            assert Image.open(page.image).size == (width * 2, height * 2)
+
+    with manifest_filepath(filepath).open() as f:
+        manifest = json.load(f)
+
+    assert manifest['encoding'] == 'delta'
+    assert manifest['iterations'] == 2
+    assert manifest['characters'] == len(num_chars)
+    assert [page['image'] for page in manifest['pages']] == [page.image.name for page in pages]
+    assert ''.join(TEXT[page['start']:page['end']] for page in manifest['pages']) == TEXT
@@ -1,10 +1,15 @@
+import mock
 import pytest
 
 from hilbertpiet.context import Context
+from hilbertpiet.layout import Layout
 from hilbertpiet.macros import Resize
 from hilbertpiet.ops import Extend, Init, Push
 from hilbertpiet.path import NoOp, NotEnoughSpace, UTurnAntiClockwise, UTurnClockwise
-from hilbertpiet.path import map_path_u_turns, map_program_to_path
+from hilbertpiet.path import _stretch_path, clear_path_cache, generate_path, iter_path, load_path
+from hilbertpiet.path import map_path_u_turns, map_program_to_path, path_capacity, path_dimensions
+from hilbertpiet.path import check_op_sizes, map_program_to_smallest_path, path_size
+from hilbertpiet.path import select_iterations
 from hilbertpiet.run import Program
 
 clockwise_params = [pytest.param(True, id='clockwise'), pytest.param(False, id='anticlockwise')]
@@ -64,6 +69,7 @@ def test_no_op(length):
     context = op(context)
 
     assert op.size == length
+    assert len(op.expanded_ops) == length
     assert context.stack == [2, 20, 3]
     assert context.value == 1
     assert context.dp == 1j
@@ -127,7 +133,7 @@ def test_map_path_u_turns(path, expected):
         [Push(), Resize(2), Push()],
         # All ops fit in first slot with 2 codels left
         [Init(),
-         Push()] + [Extend()] * 1 + [Push(), NoOp(2), UTurnClockwise(),
+         Push()] + [Extend(1)] + [Push(), NoOp(2), UTurnClockwise(),
          NoOp(6), UTurnAntiClockwise(),
          NoOp(7), UTurnClockwise(),
          NoOp(2)],
@@ -142,7 +148,7 @@ def test_map_path_u_turns(path, expected):
         # Resize + Push fit in second slot with 3 codels left
         [Init(),
          Push(), NoOp(4), UTurnClockwise()] +
-         [Extend()] * 2 + [Push(), NoOp(3), UTurnAntiClockwise(),
+         [Extend(2)] + [Push(), NoOp(3), UTurnAntiClockwise(),
          NoOp(7), UTurnClockwise(),
          NoOp(2)],
         id='resize_3'
@@ -153,7 +159,7 @@ def test_map_path_u_turns(path, expected):
         [Push(), Resize(4), Push()],
         # All ops fit in first slot with 0 codel left
         [Init(),
-         Push()] + [Extend()] * 3 + [Push(), UTurnClockwise(),
+         Push()] + [Extend(3)] + [Push(), UTurnClockwise(),
          NoOp(6), UTurnAntiClockwise(),
          NoOp(7), UTurnClockwise(),
          NoOp(2)],
@@ -171,7 +177,7 @@ def test_map_path_u_turns(path, expected):
         [Init(),
          Push(), NoOp(4), UTurnClockwise(),
          NoOp(6), UTurnAntiClockwise()] +
-         [Extend()] * 4 + [Push(), NoOp(2), UTurnClockwise(),
+         [Extend(4)] + [Push(), NoOp(2), UTurnClockwise(),
          NoOp(2)],
         id='resize_5'
     ),
@@ -183,7 +189,7 @@ def test_map_path_u_turns(path, expected):
         # Resize + Push fit in second slot with 0 codel left
         [Init(),
          Push(), NoOp(4), UTurnClockwise()] +
-         [Extend()] * 5 + [Push(), UTurnAntiClockwise(),
+         [Extend(5)] + [Push(), UTurnAntiClockwise(),
          NoOp(7), UTurnClockwise(),
          NoOp(2)],
         id='resize_6'
@@ -198,7 +204,7 @@ def test_map_path_u_turns(path, expected):
         [Init(),
          Push(), NoOp(4), UTurnClockwise(),
          NoOp(6), UTurnAntiClockwise()] +
-        [Extend()] * 6 + [Push(), UTurnClockwise(),
+        [Extend(6)] + [Push(), UTurnClockwise(),
          NoOp(2)],
         id='resize_7'
     ),
@@ -226,7 +232,126 @@ def test_map_program_to_path(path, ops, expected):
         mapped_program = map_program_to_path(program, path)
         assert mapped_program.ops == expected
 
+        # Mapping can be performed over a stream of path tokens
+        assert map_program_to_path(program, iter(path)).ops == expected
+
         # Make sure initial and mapped ops transform context stack in the same way
         context1 = program.run()
         context2 = mapped_program.run()
         assert context1.stack == context2.stack
+
+
+@pytest.mark.parametrize('iterations', [1, 2, 3])
+def test_load_path(cache_dir, iterations):
+    expected_path = map_path_u_turns(generate_path(iterations))
+
+    # Generated
+    assert list(load_path(iterations)) == expected_path
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # Cached in memory
+    assert load_path(iterations) is load_path(iterations)
+
+    # Cached on disk
+    load_path.cache_clear()
+    with mock.patch('hilbertpiet.path.iter_path') as mock_iter_path:
+        assert list(load_path(iterations)) == expected_path
+        mock_iter_path.assert_not_called()
+
+
+def test_clear_path_cache(cache_dir):
+    path = load_path(2)
+    clear_path_cache()
+
+    # Loaded again, from disk
+    with mock.patch('hilbertpiet.path.iter_path') as mock_iter_path:
+        assert load_path(2) is not path
+        assert load_path(2) == path
+        mock_iter_path.assert_not_called()
+
+
+@pytest.mark.parametrize('corrupt', [
+    pytest.param(lambda content: b'abc', id='header'),
+    pytest.param(lambda content: content[:-8], id='truncated'),
+    pytest.param(lambda content: content[:-4] + bytes([content[-4] ^ 1]) + content[-3:],
+                 id='damaged')
+])
+def test_load_path_corrupted_cache(cache_dir, corrupt):
+    load_path(2)
+    cache_filepath, = cache_dir.iterdir()
+    content = cache_filepath.read_bytes()
+    cache_filepath.write_bytes(corrupt(content))
+
+    load_path.cache_clear()
+    assert list(load_path(2)) == map_path_u_turns(generate_path(2))
+    assert cache_filepath.read_bytes() == content
+
+
+def test_load_path_failed_cache_write(cache_dir):
+    with mock.patch('os.replace', side_effect=OSError('Disk full')):
+        assert list(load_path(2)) == map_path_u_turns(generate_path(2))
+
+    # No temporary file left behind
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_load_path_unwritable_cache(cache_dir):
+    cache_dir.write_text('Not a directory')
+    assert list(load_path(2)) == map_path_u_turns(generate_path(2))
+
+
+@pytest.mark.parametrize('path,expected', [
+    ('', 'FF'),
+    ('F', 'F'),
+    ('FF', 'F' * 12),
+    ('+', 'FF+FF'),
+    ('+-', 'FF+FF-FF'),
+    ('F+F', 'F+F'),
+    ('FF-F-FFF', 'F' * 12 + '-F-' + 'F' * 17)
+])
+def test_stretch_path(path, expected):
+    assert _stretch_path(path) == expected
+
+
+@pytest.mark.parametrize('iterations', [0, 1, 2, 3, 4, 5])
+def test_iter_path(iterations):
+    assert list(iter_path(iterations)) == map_path_u_turns(generate_path(iterations))
+
+
+@pytest.mark.parametrize('iterations', [0, 1, 2, 3, 4, 5])
+def test_path_capacity(iterations):
+    path = list(iter_path(iterations))
+    assert path_capacity(iterations) == sum(token for token in path if isinstance(token, int))
+
+    program = map_program_to_path(Program([]), path)
+    assert path_size(iterations) == program.size
+
+    if iterations > 0:
+        layout = Layout.from_program(program)
+        assert path_dimensions(iterations) == (layout.xs.max() + 2, layout.ys.max() + 2)
+
+
+@pytest.mark.parametrize('size,expected', [(1, 0), (2, 1), (30, 1), (31, 2), (264, 2), (265, 3)])
+def test_select_iterations(size, expected):
+    assert select_iterations(size) == expected
+
+
+def test_select_iterations_unused_codels():
+    assert select_iterations(250) == 2
+    assert select_iterations(250, unused_codels_per_slot=1) == 3
+
+
+@pytest.mark.parametrize('value, expected', [(20, 2), (24, 2), (25, None), (30, None)])
+def test_map_program_to_smallest_path(value, expected):
+    # `Extend` operation of the resize, and push, can't be split between slots
+    program = Program([Resize(value), Push()])
+
+    if expected is None:
+        with pytest.raises(NotEnoughSpace, match='in any path'):
+            map_program_to_smallest_path(program)
+        with pytest.raises(NotEnoughSpace, match='in any path'):
+            check_op_sizes(program)
+
+    else:
+        check_op_sizes(program)
+        assert map_program_to_smallest_path(program)[1] == expected
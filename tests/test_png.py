@@ -0,0 +1,31 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from hilbertpiet.png import write_png
+from hilbertpiet.run import PALETTE
+
+
+@pytest.mark.parametrize('codel_size', [1, 3])
+@pytest.mark.parametrize('pixels_per_write', [1, 2 ** 24])
+def test_write_png(tmp_path, codel_size, pixels_per_write):
+    grid = np.random.RandomState(0).randint(len(PALETTE), size=(7, 11)).astype(np.uint8)
+    filepath = tmp_path / 'grid.png'
+
+    with mock.patch('hilbertpiet.png.PIXELS_PER_WRITE', pixels_per_write):
+        write_png(filepath, grid, PALETTE, codel_size)
+
+    img = Image.open(filepath)
+    assert img.mode == 'P'
+    assert img.size == (11 * codel_size, 7 * codel_size)
+
+    expected = PALETTE[grid].repeat(codel_size, axis=0).repeat(codel_size, axis=1)
+    assert np.array_equal(np.array(img.convert('RGB')), expected)
+
+
+def test_write_png_invalid_palette(tmp_path):
+    with pytest.raises(ValueError, match='Invalid palette of 300 colors'):
+        write_png(tmp_path / 'grid.png', np.zeros((2, 2), dtype=np.uint8),
+                  np.zeros((300, 3), dtype=np.uint8), 1)
@@ -2,6 +2,10 @@ from dataclasses import dataclass
 from typing import List
 from unittest import mock
 
+import numpy as np
+import pytest
+
+from hilbertpiet.color import Color
 from hilbertpiet.context import Context
 from hilbertpiet.macros import Macro
 from hilbertpiet.ops import Init, Op
@@ -82,3 +86,47 @@ def test_program_run():
                         # D()
                         (5, 6): (1 + 3 + 5 + 7, 2 + 4 + 6 + 8)
                     }
+
+
+def test_program_render():
+    program = Program([])
+    program.codels = {(0, 0): (0, 0), (1, 0): (1, 2), (2, 0): (2, 1), (2, 1): (0, 5)}
+
+    img = program.render(initial_color='lightblue', codel_size=2)
+
+    # One extra codel on each axis for termination codels
+    assert img.size == (4 * 2, 3 * 2)
+
+    white, black = 'white', 'black'
+    expected_codels = [
+        ['lightblue', 'red', black, 'cyan'],
+        [white, white, 'lightcyan', 'cyan'],
+        [white, white, black, 'cyan']
+    ]
+
+    def rgb(name):
+        return {white: (255, 255, 255), black: (0, 0, 0)}.get(name) or Color.from_name(name).rgb
+
+    expected_pixels = np.array([[rgb(name) for name in row] for row in expected_codels])
+    expected_pixels = expected_pixels.repeat(2, axis=0).repeat(2, axis=1)
+
+    assert np.array_equal(np.array(img), expected_pixels)
+
+
+def test_program_render_not_run():
+    with pytest.raises(RuntimeError, match="Can't render program; run it first"):
+        print(Program([]).render(initial_color='red', codel_size=2))
+
+
+def test_program_render_frames():
+    program = Program([])
+    program.codels = {(0, 0): (0, 0), (1, 0): (1, 2), (2, 0): (2, 1), (2, 1): (0, 5)}
+
+    frames = program.render_frames(codel_size=3)
+
+    assert len(frames) == 6
+    for hue, frame in enumerate(frames):
+        assert frame.mode == 'P'
+        initial_color = str(Color(lightness=1, hue=hue))
+        img = program.render(initial_color=initial_color, codel_size=3)
+        assert np.array_equal(np.array(frame.convert('RGB')), np.array(img))
@@ -0,0 +1,63 @@
+import io
+import json
+import tracemalloc
+
+import pytest
+
+from hilbertpiet.stats import Stats
+
+
+@pytest.fixture
+def stats():
+    stats = Stats(trace_memory=True)
+    yield stats
+    tracemalloc.stop()
+
+
+def test_stage(stats):
+    with stats.stage('allocate'):
+        data = bytearray(10 ** 6)
+    del data
+
+    with stats.stage('empty'):
+        pass
+
+    assert list(stats.stages) == ['allocate', 'empty']
+
+    allocate = stats.stages['allocate']
+    assert set(allocate) == {'wall_time', 'cpu_time', 'peak_memory', 'peak_rss'}
+    assert allocate['wall_time'] >= 0
+    assert allocate['cpu_time'] >= 0
+    assert allocate['peak_memory'] >= 10 ** 6
+    assert allocate['peak_rss'] >= 10 ** 6
+
+    if hasattr(tracemalloc, 'reset_peak'):
+        assert stats.stages['empty']['peak_memory'] < 10 ** 6
+
+
+def test_stage_error(stats):
+    with pytest.raises(RuntimeError):
+        with stats.stage('fail'):
+            raise RuntimeError
+
+    assert 'fail' in stats.stages
+
+
+def test_no_memory_tracing():
+    stats = Stats()
+    with stats.stage('stage'):
+        pass
+    assert set(stats.stages['stage']) == {'wall_time', 'cpu_time', 'peak_rss'}
+
+
+def test_write(stats):
+    with stats.stage('stage'):
+        pass
+    stats.update(iterations=2, codels_after_mapping=404)
+
+    f = io.StringIO()
+    stats.write(f)
+
+    assert f.getvalue().endswith('\n')
+    assert json.loads(f.getvalue()) == {'iterations': 2, 'codels_after_mapping': 404,
+                                        'stages': stats.stages}
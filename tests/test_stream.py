@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from hilbertpiet.encoding import ENCODINGS
+from hilbertpiet.layout import Layout
+from hilbertpiet.path import NotEnoughSpace, load_path, map_program_to_path
+from hilbertpiet.run import Program
+from hilbertpiet.stream import ChunkedProgram, ExpectedOutput, fits_into_path, render_program
+
+TEXT = 'Hello World!\nHello again, World!\n' * 4
+
+pytestmark = pytest.mark.usefixtures('load_numbers')
+
+
+@pytest.mark.parametrize('encoding', list(ENCODINGS))
+def test_chunked_program(encoding):
+    num_chars = [ord(c) for c in TEXT]
+    program = ChunkedProgram(num_chars, ENCODINGS[encoding], chunk_size=10)
+
+    assert program.size == Program(program.ops[1:]).size
+    assert program.expanded_ops == Program(program.ops[1:]).expanded_ops
+
+    context = program.run(compiled=True)
+    assert context.output == TEXT
+
+
+@pytest.mark.parametrize('encoding', list(ENCODINGS))
+def test_render_program(tmp_path, encoding):
+    program = ChunkedProgram([ord(c) for c in TEXT], ENCODINGS[encoding], chunk_size=10)
+    filepath = tmp_path / 'program.png'
+
+    context = render_program(program, 3, filepath, initial_color='blue', codel_size=2,
+                             chunk_size=100)
+
+    mapped_program = map_program_to_path(Program(program.ops[1:]), load_path(3))
+    expected_context = mapped_program.run(compiled=True)
+    expected_img = Layout.from_program(mapped_program).render(initial_color='blue', codel_size=2)
+
+    assert context == expected_context
+    assert context.output == TEXT
+
+    img = Image.open(filepath)
+    assert img.size == expected_img.size
+    assert np.array_equal(np.array(img.convert('RGB')), np.array(expected_img))
+
+
+def test_render_program_not_run(tmp_path):
+    program = ChunkedProgram([ord(c) for c in TEXT], ENCODINGS['plain'])
+    filepath = tmp_path / 'program.png'
+
+    assert render_program(program, 3, filepath, 'red', 1, run=False) is None
+    assert filepath.exists()
+
+
+def test_render_program_not_enough_space(tmp_path):
+    program = ChunkedProgram([ord(c) for c in TEXT], ENCODINGS['plain'])
+    filepath = tmp_path / 'program.png'
+
+    assert not fits_into_path(program, 2)
+    assert fits_into_path(program, 3)
+
+    with pytest.raises(NotEnoughSpace):
+        render_program(program, 2, filepath, 'red', 1)
+    assert not filepath.exists()
+
+
+def test_expected_output():
+    sink = ExpectedOutput('Hello')
+
+    sink.write('He')
+    assert not sink.complete
+    sink.write('llo')
+    assert sink.complete
+
+    with pytest.raises(RuntimeError, match='Program output differs from expected output after 5'):
+        sink.write('!')
@@ -0,0 +1,112 @@
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+
+from hilbertpiet.macros import Resize
+from hilbertpiet.numbers import PushNumber
+from hilbertpiet.ops import Add, Divide, Duplicate, Multiply, Op, OutChar, OutNumber, Pointer, Pop
+from hilbertpiet.ops import Push, Roll, Substract
+from hilbertpiet.path import generate_path, map_path_u_turns, map_program_to_path
+from hilbertpiet.run import Program
+from hilbertpiet.vm import PUSH, Bytecode
+
+
+def test_compile():
+    program = Program([Resize(3), Push(), Duplicate(), OutNumber()])
+    bytecode = Bytecode.compile(program)
+
+    assert len(bytecode) == 5
+    assert list(bytecode.code) == [0, 1, 0, 0,
+                                   1, 2, 0, 0,
+                                   2, 1, 1, 0,
+                                   4, 1, 0, 4,
+                                   10, 1, 1, 5]
+
+
+def test_compile_invalid_op():
+    @dataclass
+    class DummyOp(Op):
+        @property
+        def color_change(self) -> complex:
+            return 0j
+
+    with pytest.raises(ValueError, match='Invalid operation for compilation'):
+        print(Bytecode.compile(Program([DummyOp()])))
+
+
+@pytest.mark.parametrize('ops', [
+    pytest.param([Resize(3), Push(), Duplicate(), Multiply(), OutNumber()], id='out_number'),
+    pytest.param([Resize(7), Push(), Duplicate(), Push(), Substract(), Duplicate(), Add(),
+                  Resize(2), Push(), Divide(), Duplicate(), Pointer(), Push(), Pop(), OutNumber()],
+                 id='arithmetic'),
+    pytest.param([Resize(3), Push(), Pointer(), Push(), Push(), Push()], id='pointer'),
+    pytest.param([Push(), Resize(2), Push(), Resize(3), Push(), Resize(3), Push(), Push(), Roll(),
+                  OutNumber(), OutNumber(), OutNumber()], id='roll')
+])
+def test_run(ops):
+    program = Program(ops)
+
+    expected_context = program.run()
+    expected_codels = program.codels
+
+    context = program.run(compiled=True)
+
+    assert context == expected_context
+    assert program.codels == expected_codels
+
+
+def test_run_mapped_program():
+    MODULE_ROOT: Path = Path(__file__).parent.parent / 'hilbertpiet'
+    PushNumber.load_numbers(MODULE_ROOT / 'data' / 'numbers.bin')
+
+    ops = []
+    for c in 'Hello World!':
+        ops += [PushNumber(ord(c)), OutChar()]
+    program = map_program_to_path(Program(ops), map_path_u_turns(generate_path(2)))
+
+    expected_context = program.run()
+    expected_codels = program.codels
+
+    context = program.run(compiled=True)
+
+    assert context.output == 'Hello World!'
+    assert context == expected_context
+    assert list(program.codels.items()) == list(expected_codels.items())
+
+
+def test_run_null_push():
+    bytecode = Bytecode(array('q', [PUSH, 1, 1, 0]))
+    with pytest.raises(RuntimeError, match='Invalid non-positive push value'):
+        print(bytecode.run())
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_run_streamed_output(compiled):
+    class Sink:
+        def __init__(self):
+            self.writes = []
+
+        def write(self, text: str):
+            self.writes.append(text)
+
+    sink = Sink()
+    program = Program([Resize(4), Push(), Duplicate(), OutNumber(), Push(), OutChar()])
+    program.run(compiled=compiled, sink=sink)
+
+    assert sink.writes == ['4 ', '\x01']
+
+
+def test_run_chunks():
+    program = Program([Resize(4), Push(), Duplicate(), OutNumber(), Push(), Resize(2), Push(),
+                       Duplicate(), Add(), OutNumber(), Push(), OutChar()])
+    expected_context = program.run(compiled=True)
+
+    ops = list(program.iter_ops())
+    context = None
+    for chunk in (ops[:3], ops[3:8], ops[8:]):
+        context, codels = Bytecode.compile_ops(chunk).run(context=context, track_codels=False)
+        assert codels == {}
+
+    assert context == expected_context
@@ -0,0 +1,79 @@
+import io
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from hilbertpiet.cli.worker import handle_request, serve, serve_socket, warm_up
+from hilbertpiet.path import load_path
+
+DEFAULTS = {'encoding': 'delta', 'initial_color': 'red', 'codel_size': 2, 'run': True}
+
+
+@pytest.fixture(autouse=True)
+def warm(cache_dir, numbers_filepath):
+    warm_up(numbers_filepath, iterations=2)
+
+
+def test_warm_up(numbers_filepath):
+    load_path.cache_clear()
+    warm_up(numbers_filepath, iterations=2)
+    assert load_path.cache_info().currsize == 2
+
+
+def test_handle_request(tmp_path):
+    filepath = tmp_path / 'hello.png'
+    line = json.dumps({'id': 'a', 'text': 'Hello World!', 'out': str(filepath), 'codel_size': 1})
+
+    response = handle_request(line, DEFAULTS)
+
+    assert response['id'] == 'a'
+    assert response['status'] == 'ok'
+    assert response['characters'] == len('Hello World!')
+    assert filepath.exists()
+
+
+def test_handle_request_invalid(tmp_path):
+    response = handle_request('{"id": 1', DEFAULTS)
+    assert response['id'] is None
+    assert response['status'] == 'error'
+
+    response = handle_request(json.dumps({'id': 2, 'text': 'Hi'}), DEFAULTS)
+    assert response['id'] == 2
+    assert response['status'] == 'error'
+
+    line = json.dumps({'id': 3, 'text': 'Hi', 'out': str(tmp_path / 'hi.png'), 'encoding': 'zip'})
+    response = handle_request(line, DEFAULTS)
+    assert response == {'id': 3, 'status': 'error', 'error': 'ValueError: Invalid encoding: zip'}
+
+
+def test_serve(tmp_path):
+    requests = [json.dumps({'id': i, 'text': f'Hello {i}', 'out': str(tmp_path / f'{i}.png')})
+                for i in range(3)]
+    responses = io.StringIO()
+
+    serve(requests[:1] + ['\n'] + requests[1:], responses, DEFAULTS)
+
+    responses = [json.loads(line) for line in responses.getvalue().splitlines()]
+    assert [response['id'] for response in responses] == [0, 1, 2]
+    assert all(response['status'] == 'ok' for response in responses)
+
+
+def test_serve_socket(tmp_path):
+    socket_filepath = tmp_path / 'worker.sock'
+    thread = threading.Thread(target=serve_socket, args=(socket_filepath, DEFAULTS), daemon=True)
+    thread.start()
+    while not socket_filepath.exists():
+        time.sleep(0.01)
+
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(str(socket_filepath))
+        f = client.makefile('rw')
+        for i in range(2):
+            f.write(json.dumps({'id': i, 'text': 'Hi', 'out': str(tmp_path / f'{i}.png')}) + '\n')
+            f.flush()
+            response = json.loads(f.readline())
+            assert response['id'] == i
+            assert response['status'] == 'ok'